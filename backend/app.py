@@ -1,15 +1,22 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
-from services.stock_service import get_stock_data, format_stock_symbol, get_stock_info
-from services.data_analysis import analyze_stock_data
-from services.analysis_service import StockAnalyzer
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
+from services.stock_service import get_stock_data, format_stock_symbol, get_stock_info, get_stocks_data_batch
+from services.indicators import IndicatorEngine
+from services.cache import get_all_cache_stats
+from services.snapshots import load_analysis, load_analyses
+from services.http_cache import stock_validators, is_not_modified, not_modified_response, set_validators, compress_response
+from services.market_context import get_market_context
+from services.concurrency import submit, gather
+from services.clients import configure_clients
+from services.resilience import with_deadline, get_all_upstream_status
+from services.screener import screen
+from services.prefetch import record_access, get_prefetch_status
+from services.backtest import run_backtest, parameter_sweep, summarize
+from services.llm_service import submit_llm_analysis, get_llm_job, stream_llm_job
 import logging
 import asyncio
-import numpy as np
 import os
+import config
 from config import DEEPSEEK_API_KEY  # 导入配置
 import json
 
@@ -30,660 +37,376 @@ CORS(app)
 # 使用配置文件中的API密钥
 os.environ["DEEPSEEK_API_KEY"] = DEEPSEEK_API_KEY
 
-def analyze_stock_risk(data, analysis):
-    """分析股票风险和给出建议"""
-    try:
-        # 获取最新数据
-        latest_price = data[-1]['close']
-        latest_ma5 = analysis['moving_average']['MA5'][-1]
-        latest_ma20 = analysis['moving_average']['MA20'][-1]
-        rsi = analysis['rsi'][-1]
-        volatility = analysis['volatility']
-        
-        # 计算价格趋势
-        price_trend = []
-        trends = {
-            '日线': 1,
-            '周线': 5,
-            '月线': 20,
-            '季线': 60
-        }
-        
-        for period_name, days in trends.items():
-            if len(data) >= days:
-                change = (latest_price - data[-days]['close']) / data[-days]['close'] * 100
-                price_trend.append({
-                    'name': period_name,
-                    'change': round(change, 2),
-                    'trend': '上涨' if change > 0 else '下跌'
-                })
+# 网络代理和连接池配置（可选）
+configure_clients(
+    proxy=getattr(config, 'HTTP_PROXY', None),
+    pool_size=getattr(config, 'HTTP_POOL_SIZE', None)
+)
 
-        # 计算支撑位和压力位
-        support_resistance = calculate_support_resistance(data, latest_price)
-        
-        # 计算成交量分析
-        volume_analysis = analyze_volume(data)
-        
-        # 趋势强度分析
-        trend_strength = analyze_trend_strength(data, analysis)
-        
-        # 综合分析
-        risk_factors = []
-        opportunity_factors = []
-        risk_level = "中等"
-        risk_score = 50  # 基础风险分数
-        
-        # RSI 分析
-        if rsi > 70:
-            risk_factors.append(f"RSI超买({rsi:.2f} > 70)，股价可能存在回调风险")
-            risk_score += 20
-        elif rsi < 30:
-            opportunity_factors.append(f"RSI超卖({rsi:.2f} < 30)，股价可能存在反弹机会")
-            risk_score -= 10
-        
-        # 波动率分析
-        if volatility > 0.03:
-            risk_factors.append(f"波动率较高({volatility * 100:.2f}%)，注意控制仓位")
-            risk_score += 15
-        elif volatility < 0.01:
-            opportunity_factors.append(f"波动率较低({volatility * 100:.2f}%)，可能存在��破机会")
-        
-        # 均线分析
-        if latest_price < latest_ma5 < latest_ma20:
-            risk_factors.append("价格处于双均线下方，可能处于下跌趋势")
-            risk_score += 15
-        elif latest_price > latest_ma5 > latest_ma20:
-            opportunity_factors.append("价格处于双均线上方，可能处于上涨趋势")
-            risk_score -= 10
-            
-        # 成交量分析
-        if volume_analysis['volume_trend'] == '放量':
-            if trend_strength['trend'] == '上涨':
-                opportunity_factors.append("放量上涨，上涨趋势确立")
-                risk_score -= 10
-            elif trend_strength['trend'] == '下跌':
-                risk_factors.append("放量下跌，下跌趋势确立")
-                risk_score += 15
-        elif volume_analysis['volume_trend'] == '缩量':
-            if trend_strength['trend'] == '上涨':
-                risk_factors.append("缩量上涨，上涨动能不足")
-                risk_score += 10
-            elif trend_strength['trend'] == '下跌':
-                opportunity_factors.append("缩量下跌，���跌动能减弱")
-                risk_score -= 5
+# 各阶段超时时间（秒）
+STAGE_TIMEOUTS = {
+    'data': 20,
+    'info': 8,
+    'market': 10
+}
 
-        # 趋势强度分析
-        if trend_strength['strength'] > 0.7:
-            if trend_strength['trend'] == '上涨':
-                opportunity_factors.append(f"强势上涨，趋势强度{trend_strength['strength']:.2f}")
-            else:
-                risk_factors.append(f"强势下跌，趋势强度{trend_strength['strength']:.2f}")
-                risk_score += 20
-        
-        # 支撑位/压力位分析
-        price_position = analyze_price_position(latest_price, support_resistance)
-        if price_position['position'] == 'near_support':
-            opportunity_factors.append(f"接近支撑位{price_position['level']:.2f}，可能存在反弹机会")
-        elif price_position['position'] == 'near_resistance':
-            risk_factors.append(f"接近压力位{price_position['level']:.2f}，注意突破确认")
-            risk_score += 10
+# 接口截止时间（秒），传递到各阶段的网络请求，超时前未完成的上游调用会被拒绝
+REQUEST_TIMEOUT = 20
+BATCH_TIMEOUT = 60
 
-        # 根据风险分数确定风险等级
-        if risk_score >= 70:
-            risk_level = "较高"
-        elif risk_score <= 30:
-            risk_level = "较低"
-        
-        # 如果没有风险因素，添加默认提示
-        if not risk_factors and not opportunity_factors:
-            risk_factors.append("当前未发现明显风险信号")
-            risk_level = "较低"
-        
-        # 趋势判断
-        trend = trend_strength['trend']
-        
-        # 操作建议
-        position_advice = generate_position_advice(
-            risk_level, 
-            trend_strength, 
-            volume_analysis, 
-            price_position
-        )
-        
-        # 具体操作建议
-        action_advice = generate_action_advice(
-            trend_strength,
-            volume_analysis,
-            price_position,
-            risk_level
-        )
-        
-        return {
-            "risk_level": risk_level,
-            "risk_score": risk_score,
-            "risk_factors": risk_factors,
-            "opportunity_factors": opportunity_factors,
-            "trend": trend,
-            "trend_strength": trend_strength,
-            "price_trend": price_trend,
-            "volume_analysis": volume_analysis,
-            "support_resistance": support_resistance,
-            "position_advice": position_advice,
-            "action_advice": action_advice,
-            "technical_indicators": {
-                "rsi": round(rsi, 2),
-                "volatility": round(volatility * 100, 2),
-                "ma5": round(latest_ma5, 2),
-                "ma20": round(latest_ma20, 2),
-                "volume_ratio": round(volume_analysis['volume_ratio'], 2)
-            }
-        }
-    except Exception as e:
-        logger.error(f"分析错误: {str(e)}")
-        return None
+MAX_BATCH_SYMBOLS = 50  # 批量接口单次请求的最大股票数
+MAX_INDICATORS = 20  # 指标接口单次请求的最大指标数
 
-def calculate_support_resistance(data, current_price):
-    """计算支撑位和压力位"""
-    prices = [d['low'] for d in data] + [d['high'] for d in data]
-    prices.sort()
-    
-    support_levels = []
-    resistance_levels = []
-    
-    for price in prices:
-        if price < current_price:
-            if not support_levels or abs(price - support_levels[-1]) > current_price * 0.01:
-                support_levels.append(price)
-        else:
-            if not resistance_levels or abs(price - resistance_levels[-1]) > current_price * 0.01:
-                resistance_levels.append(price)
-    
-    return {
-        "support": support_levels[-3:] if support_levels else [],
-        "resistance": resistance_levels[:3] if resistance_levels else []
-    }
-
-def analyze_volume(data):
-    """分析成交量"""
-    recent_volume = sum(d['volume'] for d in data[-5:]) / 5
-    old_volume = sum(d['volume'] for d in data[-10:-5]) / 5
-    volume_ratio = recent_volume / old_volume
-    
-    volume_trend = '平稳'
-    if volume_ratio > 1.5:
-        volume_trend = '放量'
-    elif volume_ratio < 0.7:
-        volume_trend = '缩量'
-    
-    return {
-        "volume_ratio": volume_ratio,
-        "volume_trend": volume_trend,
-        "description": f"近5日成交量为前5日的{volume_ratio:.2f}倍"
-    }
+@app.after_request
+def compress(response):
+    """较大的 JSON 响应按 Accept-Encoding 压缩"""
+    return compress_response(request, response)
 
-def analyze_trend_strength(data, analysis):
-    """分析趋势强度"""
+# 修改主要的分析函数
+@app.route('/api/stock/<market>/<symbol>', methods=['GET'])
+@with_deadline(REQUEST_TIMEOUT)
+def get_stock(market, symbol):
     try:
-        if not data or len(data) < 20:  # 确保有足够的数据点
-            return None
-            
-        # 计算方向一致性
-        price_changes = [data[i]['close'] - data[i-1]['close'] for i in range(1, len(data))]
-        direction_consistency = sum(1 for x in price_changes[-20:] if x > 0) / 20
-        
-        # 计算突破强度
-        ma_distance = 0
-        if analysis and 'moving_average' in analysis:
-            ma20 = analysis['moving_average']['MA20'][-1]
-            ma_distance = (data[-1]['close'] - ma20) / ma20
-        else:
-            # 如果没有提供分析数据，计算简单的价格偏离度
-            avg_price = sum(d['close'] for d in data[-20:]) / 20
-            ma_distance = (data[-1]['close'] - avg_price) / avg_price
+        logger.info(f'收到请求 - 市场: {market}, 股票代码: {symbol}')
+        period = request.args.get('period', '1y')
+        refresh = request.args.get('refresh', '').lower() == 'true'
         
-        # 计算趋势强度
-        strength = (direction_consistency + abs(ma_distance)) / 2
+        # 并行获取个股数据、股票基本信息和大盘数据（进程内共享缓存，含预先计算的大盘分析）
+        futures = {
+            'data': submit(get_stock_data, market, symbol, period, refresh),
+            'info': submit(get_stock_info, market, symbol),
+            'market': submit(get_market_context, market)
+        }
+        results, errors = gather({'data': futures.pop('data')}, STAGE_TIMEOUTS)
+        if 'data' not in results:
+            raise Exception(f"获取股票数据失败: {errors['data']}")
+        data = results['data']
+        # 成功获取数据后才记录访问热度，收盘后由后台任务预先刷新热门股票
+        record_access(market, symbol, period)
+        # 基础分析和智能分析按K线指纹读取快照，K线未变化时不重新计算
+        snapshot = load_analysis('stock', data, period)
+        analysis = snapshot['analysis']
+        smart_analysis = snapshot['smart_analysis']
+        
+        results, stage_errors = gather(futures, STAGE_TIMEOUTS)
+        errors.update(stage_errors)
+        stock_info = results.get('info')
+        market_context = results.get('market')
+        
+        # 添加LLM分析：后台任务执行，前端通过任务ID轮询或流式获取结果
+        # （返回 304 时也提交，任务ID不变，客户端缓存中的任务可继续轮询）
+        smart_analysis['llm_analysis'] = submit_llm_analysis(data, analysis)
+        
+        # K线和分析版本未变化时返回 304，省去序列化和传输；部分阶段失败的降级结果不参与缓存
+        etag, last_modified = stock_validators(data, period, market_context)
+        if not errors and is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
         
-        trend = '上涨' if direction_consistency > 0.5 else '下跌'
+        # 添加大盘分析
+        if market_context and market_context['analysis']:
+            market_analysis = load_analysis('market', data, period, market_context)
+            if market_analysis:
+                smart_analysis['market_analysis'] = market_analysis
         
-        return {
-            "trend": trend,
-            "strength": strength,
-            "direction_consistency": direction_consistency,
-            "ma_distance": ma_distance
+        analysis['smart_analysis'] = smart_analysis
+
+        response = {
+            'status': 'success',
+            'data': data.to_records(),
+            'stock_info': stock_info,
+            'analysis': analysis
         }
+        if errors:
+            # 部分阶段超时或失败时仍返回已有结果
+            response['partial'] = errors
+            return jsonify(response)
+        return set_validators(jsonify(response), etag, last_modified)
     except Exception as e:
-        logger.error(f"分析趋势强度失败: {str(e)}")
-        return None
-
-def analyze_price_position(price, support_resistance):
-    """分析价格位置"""
-    if support_resistance['support']:
-        nearest_support = max(support_resistance['support'])
-        if abs(price - nearest_support) / price < 0.02:
-            return {"position": "near_support", "level": nearest_support}
-    
-    if support_resistance['resistance']:
-        nearest_resistance = min(support_resistance['resistance'])
-        if abs(price - nearest_resistance) / price < 0.02:
-            return {"position": "near_resistance", "level": nearest_resistance}
-    
-    return {"position": "middle", "level": None}
-
-def generate_position_advice(risk_level, trend_strength, volume_analysis, price_position):
-    """生成仓位建议"""
-    base_position = {
-        "较高": 30,
-        "中等": 50,
-        "较低": 70
-    }[risk_level]
-    
-    position_advice = f"建议仓位控制在{base_position}%以下"
-    
-    if trend_strength['strength'] > 0.7 and trend_strength['trend'] == '上涨':
-        position_advice += "，可以适当增加仓位"
-    elif trend_strength['strength'] > 0.7 and trend_strength['trend'] == '下跌':
-        position_advice += "，建议降低���位"
-    
-    if volume_analysis['volume_trend'] == '放量':
-        position_advice += "，注意成交量变化"
-    
-    if price_position['position'] != 'middle':
-        position_advice += "，关注价格突破情况"
-    
-    return position_advice
-
-def generate_action_advice(trend_strength, volume_analysis, price_position, risk_level):
-    """生成具体操作建议"""
-    advices = []
-    
-    # 趋势强度建议
-    if trend_strength['strength'] > 0.7:
-        if trend_strength['trend'] == '上涨':
-            advices.append("趋势强劲，可以考虑逢低买入")
-        else:
-            advices.append("下跌趋势明显，建议观望或减仓")
-    else:
-        advices.append("趋势不明确，建议等待明确信号")
-    
-    # 成交量建议
-    if volume_analysis['volume_trend'] == '放量':
-        if trend_strength['trend'] == '上涨':
-            advices.append("放量上涨，可以适度跟进")
-        else:
-            advices.append("放量下跌，建议规避风险")
-    elif volume_analysis['volume_trend'] == '缩量':
-        advices.append("成交量萎缩，建议等待成交量放大")
-    
-    # 价格位置建议
-    if price_position['position'] == 'near_support':
-        advices.append(f"接近支撑位{price_position['level']:.2f}，可以考虑��量试探性买入")
-    elif price_position['position'] == 'near_resistance':
-        advices.append(f"接近压力位{price_position['level']:.2f}，建议设置止损")
-    
-    # 风险等级建议
-    if risk_level == "较高":
-        advices.append("当前风险较高，建议以观望为主")
-    
-    return advices
+        logger.error(f'处理请求时发生错误: {str(e)}', exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
 
-def get_market_index_data(market):
-    """获取大盘指数数据"""
+@app.route('/api/stock/<market>/<symbol>/analysis', methods=['GET'])
+@with_deadline(REQUEST_TIMEOUT)
+def analyze_stock(market, symbol):
     try:
-        # 根据市场获取对应的指数
-        index_symbol = {
-            'CN': {
-                'SH': '000001',  # 上证指数
-                'SZ': '399001'   # 深证成指
-            },
-            'US': '^GSPC'           # 标普500
-        }.get(market)
-        
-        if not index_symbol:
-            return None
-            
-        # 获取指数数据
-        if market == 'CN':
-            # 根据股票代码判断使用哪个指数
-            index_data = get_stock_data('CN', index_symbol['SH'])  # 直接使用带后缀的代���
-        else:
-            index_data = get_stock_data(market, index_symbol)
-            
-        return index_data
-    except Exception as e:
-        logger.error(f"获取大盘数据失败: {str(e)}")
-        return None
-
-def analyze_market_trend(index_data):
-    """分析大盘走势"""
-    if not index_data or len(index_data) < 60:  # 确保有足够的数据点
-        logger.warning("大盘数据不足或为空")
-        return None
+        logger.info(f'收到分析请求 - 市场: {market}, 股票代码: {symbol}')
         
-    try:
-        # 计算大盘趋势
-        latest_price = index_data[-1]['close']
-        periods = {
-            '日': 1,
-            '周': 5,
-            '��': 20,
-            '季': 60
-        }
+        # 获取股票数据
+        data = get_stock_data(market, symbol)
         
-        trends = {}
-        for name, days in periods.items():
-            if len(index_data) >= days:
-                change = (latest_price - index_data[-days]['close']) / index_data[-days]['close'] * 100
-                trends[name] = {
-                    'change': round(change, 2),
-                    'trend': '上涨' if change > 0 else '下跌'
-                }
+        etag, last_modified = stock_validators(data, '1y')
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
         
-        # 计算大盘强度
-        strength = analyze_trend_strength(index_data, None)
-        if not strength:  # 检查强度计算结果
-            return None
-            
-        # 计算市场情绪
-        sentiment = analyze_market_sentiment(index_data)
-        if not sentiment:  # 检查情绪分析结果
-            return None
+        # 读取分析快照，K线变化后才重新执行分析
+        analysis_result = load_analysis('analyzer', data, '1y')
         
-        return {
-            'trends': trends,
-            'strength': strength,
-            'sentiment': sentiment
-        }
+        logger.info('分析完成')
+        return set_validators(jsonify({
+            'status': 'success',
+            'data': analysis_result
+        }), etag, last_modified)
     except Exception as e:
-        logger.error(f"分析大盘走势失败: {str(e)}")
-        return None
+        logger.error(f'分析请求处理失败: {str(e)}', exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+@app.route('/api/stock/<market>/<symbol>/indicators', methods=['POST'])
+@with_deadline(REQUEST_TIMEOUT)
+def get_indicators(market, symbol):
+    """按参数计算技术指标
 
-def analyze_market_sentiment(index_data):
-    """分析市场情绪"""
+    请求体: {"period": "1y", "indicators": [{"type": "MA", "params": {"period": 10}}, ...]}
+    支持 MA、EMA、MACD、RSI、KDJ、BOLL，结果按股票、最后一根K线和参数缓存
+    """
     try:
-        if not index_data or len(index_data) < 20:  # 确保有足够的数据点
-            return None
-            
-        # 计算最近20天的上涨天数
-        up_days = sum(1 for i in range(1, min(20, len(index_data)))
-                     if index_data[-i]['close'] > index_data[-i-1]['close'])
-        
-        # 计算成交量变化
-        recent_volume = sum(d['volume'] for d in index_data[-5:]) / 5
-        old_volume = sum(d['volume'] for d in index_data[-10:-5]) / 5
-        volume_ratio = recent_volume / old_volume if old_volume > 0 else 1.0
-        
-        # 计算波动率
-        returns = [(index_data[i]['close'] - index_data[i-1]['close']) / index_data[i-1]['close']
-                  for i in range(1, len(index_data))]
-        volatility = np.std(returns) * np.sqrt(252)  # 年化波动率
-        
-        # 综合评估市场情绪
-        sentiment_score = 0
-        sentiment_factors = []
-        
-        # ��据上涨天数评估
-        if up_days >= 15:
-            sentiment_score += 30
-            sentiment_factors.append("市场持续上涨，情绪偏乐观")
-        elif up_days <= 5:
-            sentiment_score -= 30
-            sentiment_factors.append("市场持续下跌，情绪偏悲观")
-        
-        # 根据成交量评估
-        if volume_ratio > 1.5:
-            sentiment_score += 20
-            sentiment_factors.append("成交量明显放大，市场活跃度提升")
-        elif volume_ratio < 0.7:
-            sentiment_score -= 20
-            sentiment_factors.append("成交量明显萎缩，市场活跃度下降")
-        
-        # 根据波动率评估
-        if volatility > 0.3:  # 30%的年化波动率
-            sentiment_score -= 10
-            sentiment_factors.append("市场波动剧烈，风险偏好降低")
-        elif volatility < 0.1:  # 10%的年化波动率
-            sentiment_score += 10
-            sentiment_factors.append("市场波动平稳，风险偏好适")
-        
-        # 确定情绪状态
-        if sentiment_score >= 30:
-            sentiment = "乐观"
-        elif sentiment_score <= -30:
-            sentiment = "悲观"
-        else:
-            sentiment = "中性"
-            
-        return {
-            'score': sentiment_score,
-            'state': sentiment,
-            'factors': sentiment_factors,
-            'metrics': {
-                'up_days_ratio': round(up_days / 20 * 100, 2),
-                'volume_ratio': round(volume_ratio, 2),
-                'volatility': round(volatility * 100, 2)
+        payload = request.get_json(silent=True) or {}
+        period = payload.get('period', '1y')
+        specs = payload.get('indicators') or []
+        if not specs:
+            raise Exception('请提供指标配置')
+        if len(specs) > MAX_INDICATORS:
+            raise Exception(f'单次最多计算{MAX_INDICATORS}个指标')
+        logger.info(f'收到指标请求 - 市场: {market}, 股票代码: {symbol}, 指标数: {len(specs)}')
+        
+        data = get_stock_data(market, symbol, period)
+        indicators = IndicatorEngine(data)
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'dates': data.date_strings().tolist(),
+                'indicators': [indicators.compute(spec) for spec in specs]
             }
-        }
+        })
     except Exception as e:
-        logger.error(f"分析市场情绪失败: {str(e)}")
-        return None
+        logger.error(f'指标计算失败: {str(e)}', exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+@app.route('/api/stocks/batch', methods=['POST'])
+@with_deadline(BATCH_TIMEOUT)
+def get_stocks_batch():
+    """批量获取多只股票的最新行情和分析结果
 
-def analyze_stock_with_market(stock_data, market_data):
-    """结合大盘走势分析个股"""
+    请求体: {"market": "US", "symbols": ["AAPL", ...], "period": "1y", "refresh": false}
+    symbols 中也可以是 {"market": "CN", "symbol": "600000"}，用于混合市场的自选股/搜索历史
+    """
     try:
-        market_analysis = analyze_market_trend(market_data)
-        if not market_analysis:
-            return None
-            
-        # 计算个股相对大盘的表现
-        relative_strength = calculate_relative_strength(stock_data, market_data)
-        
-        # 生成分析结论
-        conclusions = []
-        
-        # 大盘趋势分析
-        market_trend = market_analysis['trends'].get('周', {}).get('trend')
-        if market_trend:
-            conclusions.append(f"大盘{market_trend}趋势下，")
-            if relative_strength > 1.1:
-                conclusions.append("个股表现强于大盘，可能存在独立行情")
-            elif relative_strength < 0.9:
-                conclusions.append("个股表现弱于大盘，需要关注基本面变化")
+        payload = request.get_json(silent=True) or {}
+        period = payload.get('period', '1y')
+        refresh = bool(payload.get('refresh', False))
+        items = payload.get('symbols') or []
+        if len(items) > MAX_BATCH_SYMBOLS:
+            raise Exception(f'单次最多查询{MAX_BATCH_SYMBOLS}只股票')
+        
+        # 按市场分组
+        grouped = {}
+        for item in items:
+            if isinstance(item, dict):
+                market, symbol = item.get('market'), item.get('symbol')
             else:
-                conclusions.append("个股走势与大盘同步")
-        
-        # 市场情绪分析
-        sentiment = market_analysis['sentiment']['state']
-        if sentiment == "乐观":
-            conclusions.append("市场情绪偏乐观，可以适当提高仓位")
-        elif sentiment == "悲观":
-            conclusions.append("市场情绪偏悲观，建议降低仓位")
+                market, symbol = payload.get('market'), item
+            if market and symbol:
+                grouped.setdefault(market, []).append(str(symbol))
+        if not grouped:
+            raise Exception('请提供股票代码列表')
+        logger.info(f'收到批量请求 - {grouped}')
+        
+        results = []
+        for market, symbols in grouped.items():
+            data_by_symbol = get_stocks_data_batch(market, symbols, period, refresh)
+            analyses, analysis_errors = load_analyses('stock', market, data_by_symbol, period)
+            for symbol in symbols:
+                data = data_by_symbol.get(symbol)
+                if not data:
+                    results.append({
+                        'market': market,
+                        'symbol': symbol,
+                        'status': 'error',
+                        'message': '获取数据失败'
+                    })
+                    continue
+                if symbol in analysis_errors:
+                    results.append({
+                        'market': market,
+                        'symbol': symbol,
+                        'status': 'error',
+                        'message': str(analysis_errors[symbol])
+                    })
+                    continue
+                results.append({
+                    'market': market,
+                    'symbol': symbol,
+                    'status': 'success',
+                    'latest': data[-1],
+                    'smart_analysis': analyses[symbol]['smart_analysis']
+                })
         
-        return {
-            'market_analysis': market_analysis,
-            'relative_strength': round(relative_strength, 2),
-            'conclusions': conclusions
-        }
+        return jsonify({
+            'status': 'success',
+            'data': results
+        })
     except Exception as e:
-        logger.error(f"结合大盘分析���败: {str(e)}")
-        return None
+        logger.error(f'批量请求处理失败: {str(e)}', exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
 
-def calculate_relative_strength(stock_data, market_data):
-    """计算个股相对大盘的强度"""
-    try:
-        # 计算最近20天的收益率
-        stock_return = (stock_data[-1]['close'] - stock_data[-20]['close']) / stock_data[-20]['close']
-        market_return = (market_data[-1]['close'] - market_data[-20]['close']) / market_data[-20]['close']
-        
-        # 计算相对强度
-        relative_strength = (1 + stock_return) / (1 + market_return)
-        return relative_strength
-    except Exception:
-        return 1.0
+@app.route('/api/screener', methods=['POST'])
+def screen_stocks():
+    """在本地已存储的全部股票中按条件选股
 
-def get_llm_analysis(stock_data, technical_analysis):
-    """使用LangChain和Deepseek模型分析股票趋势"""
+    请求体: {"market": "CN", "conditions": ["rsi < 30", "close > ma20", "volume_ratio > 1.5"],
+             "sort": "volume_ratio", "order": "desc", "limit": 100, "include_indices": false}
+    """
     try:
-        # 初始化ChatOpenAI（使用Deepseek模型）
-        llm = ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=DEEPSEEK_API_KEY,
-            openai_api_base="https://api.deepseek.com/v1",
-            temperature=0.7
-        )
-        
-        # 创建分析提示模板
-        prompt_template = ChatPromptTemplate.from_template(
-            """
-            作为一个专业的股票分析师，请基于以下数据分析该股票的走势：
-            
-            最近的股票数据:
-            {stock_data}
-            
-            技术指标数据:
-            {technical_indicators}
-            
-            请提供以下分析：
-            1. 总体趋势判断
-            2. 主要支撑和阻力位
-            3. 短期投资建议
-            4. 需要关注的风险点
-            
-            请用专业的角度进行分析，并给出具体的数据支持。
-            """
+        payload = request.get_json(silent=True) or {}
+        market = payload.get('market')
+        conditions = payload.get('conditions') or []
+        if not market:
+            raise Exception('请指定市场')
+        if not conditions:
+            raise Exception('请提供筛选条件')
+        logger.info(f'收到选股请求 - 市场: {market}, 条件: {conditions}')
+        
+        result = screen(
+            market,
+            conditions,
+            sort=payload.get('sort'),
+            order=payload.get('order', 'desc'),
+            limit=payload.get('limit', 100),
+            include_indices=bool(payload.get('include_indices', False))
         )
-        
-        # 创建分析链
-        chain = prompt_template | llm
-        
-        # 准备输入数据
-        recent_data = stock_data[-5:]  # 最近5天数据
-        technical_indicators = {
-            'RSI': technical_analysis.get('rsi', [])[-1] if technical_analysis.get('rsi') else None,
-            'MA5': technical_analysis['moving_average']['MA5'][-1] if technical_analysis.get('moving_average') else None,
-            'MA20': technical_analysis['moving_average']['MA20'][-1] if technical_analysis.get('moving_average') else None,
-            'volatility': technical_analysis.get('volatility'),
-        }
-        
-        # 格式化数据为更易读的格式
-        formatted_data = []
-        for day in recent_data:
-            formatted_data.append({
-                '日期': day.get('date', ''),
-                '开盘': round(day.get('open', 0), 2),
-                '最高': round(day.get('high', 0), 2),
-                '最低': round(day.get('low', 0), 2),
-                '��盘': round(day.get('close', 0), 2),
-                '成交量': day.get('volume', 0)
-            })
-
-        formatted_indicators = {
-            'RSI指标': round(technical_indicators['RSI'], 2) if technical_indicators['RSI'] else None,
-            '5日均线': round(technical_indicators['MA5'], 2) if technical_indicators['MA5'] else None,
-            '20日均线': round(technical_indicators['MA20'], 2) if technical_indicators['MA20'] else None,
-            '波动率': f"{round(technical_indicators['volatility'] * 100, 2)}%" if technical_indicators['volatility'] else None
-        }
-        
-        # 执行分析
-        response = chain.invoke({
-            "stock_data": json.dumps(formatted_data, indent=2, ensure_ascii=False),
-            "technical_indicators": json.dumps(formatted_indicators, indent=2, ensure_ascii=False)
-        }).content
-        
-        logger.info(f"AI分析响应: {response}")
-        
-        # 如果响应为空，返回默认分析
-        if not response:
-            return {
-                "llm_analysis": "AI分析服务暂时不可用，请稍后重试。",
-                "analysis_type": "AI智能分析",
-                "model": "deepseek-chat"
-            }
-        
-        return {
-            "llm_analysis": response,
-            "analysis_type": "AI智能分析",
-            "model": "deepseek-chat"
-        }
-        
-    except Exception as e:
-        logger.error(f"LLM分析失败: {str(e)}", exc_info=True)
-        return {
-            "llm_analysis": f"AI分析生成失败: {str(e)}",
-            "analysis_type": "AI智能分析",
-            "model": "deepseek-chat"
-        }
-
-# 修改主要的分析函数
-@app.route('/api/stock/<market>/<symbol>', methods=['GET'])
-def get_stock(market, symbol):
-    try:
-        logger.info(f'收到请求 - 市场: {market}, 股票代码: {symbol}')
-        period = request.args.get('period', '1y')
-        refresh = request.args.get('refresh', '').lower() == 'true'
-        
-        # 获取个股数据
-        data = get_stock_data(market, symbol, period, refresh)
-        # 获取股票基本信息
-        stock_info = get_stock_info(market, symbol)
-        analysis = analyze_stock_data(data)
-        
-        # 获取大盘数据
-        market_data = get_market_index_data(market)
-        
-        # 添加智能分析
-        smart_analysis = analyze_stock_risk(data, analysis)
-        
-        # 添加LLM分析
-        llm_analysis = get_llm_analysis(data, analysis)
-        logger.info(f'LLM分析结果: {llm_analysis}')
-        smart_analysis['llm_analysis'] = llm_analysis
-        
-        # 添加大盘分析
-        if market_data:
-            market_analysis = analyze_stock_with_market(data, market_data)
-            if market_analysis:
-                smart_analysis['market_analysis'] = market_analysis
-        
-        analysis['smart_analysis'] = smart_analysis
-
         return jsonify({
             'status': 'success',
-            'data': data,
-            'stock_info': stock_info,
-            'analysis': analysis
+            'data': result
         })
     except Exception as e:
-        logger.error(f'处理请求时发生错误: {str(e)}', exc_info=True)
+        logger.error(f'选股请求处理失败: {str(e)}', exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 400
 
-@app.route('/api/stock/<market>/<symbol>/analysis', methods=['GET'])
-def analyze_stock(market, symbol):
+@app.route('/api/backtest', methods=['POST'])
+@with_deadline(BATCH_TIMEOUT)
+def backtest_stocks():
+    """回测智能分析给出的买卖建议
+
+    请求体: {"market": "US", "symbols": ["AAPL", ...], "period": "5y",
+             "params": {"strategy": "analyzer", "threshold": 0.5, ...},
+             "sweep": {"threshold": [0.3, 0.5], "trend_confidence": [0.5, 0.7]}, "sort_by": "sharpe"}
+    提供 sweep 时返回各参数组合在所有股票上的平均绩效，否则返回每只股票的回测结果
+    """
     try:
-        logger.info(f'收到分析请求 - 市场: {market}, 股票代码: {symbol}')
-        
-        # 获取股票数据
-        data = get_stock_data(market, symbol)
-        
-        # 创建分析器并执行分析
-        analyzer = StockAnalyzer(data)
-        analysis_result = analyzer.analyze()
-        
-        logger.info('分析完成')
+        payload = request.get_json(silent=True) or {}
+        market = payload.get('market')
+        symbols = [str(symbol) for symbol in payload.get('symbols') or []]
+        period = payload.get('period', '5y')
+        params = payload.get('params') or {}
+        sweep = payload.get('sweep')
+        if not market or not symbols:
+            raise Exception('请提供市场和股票代码列表')
+        if len(symbols) > MAX_BATCH_SYMBOLS:
+            raise Exception(f'单次最多回测{MAX_BATCH_SYMBOLS}只股票')
+        logger.info(f'收到回测请求 - 市场: {market}, 股票数: {len(symbols)}, 参数扫描: {bool(sweep)}')
+        
+        data_by_symbol = get_stocks_data_batch(market, symbols, period)
+        missing = [symbol for symbol in symbols if not data_by_symbol.get(symbol)]
+        bars_by_symbol = {symbol: data for symbol, data in data_by_symbol.items() if data}
+        if not bars_by_symbol:
+            raise Exception('获取数据失败')
+        
+        if sweep:
+            data = {
+                'sweep': parameter_sweep(bars_by_symbol, sweep, params, payload.get('sort_by', 'sharpe'))
+            }
+        else:
+            results = [
+                {'symbol': symbol, **run_backtest(bars, params)}
+                for symbol, bars in bars_by_symbol.items()
+            ]
+            data = {
+                'results': results,
+                'summary': summarize(results)
+            }
+        data['missing'] = missing
         return jsonify({
             'status': 'success',
-            'data': analysis_result
+            'data': data
         })
     except Exception as e:
-        logger.error(f'分析请求处理失败: {str(e)}', exc_info=True)
+        logger.error(f'回测请求处理失败: {str(e)}', exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 400
 
+@app.route('/api/llm/jobs/<job_id>', methods=['GET'])
+def get_llm_job_status(job_id):
+    """轮询LLM分析任务状态"""
+    job = get_llm_job(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': '分析任务不存在或已过期'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'data': job
+    })
+
+@app.route('/api/llm/jobs/<job_id>/stream', methods=['GET'])
+def stream_llm_job_output(job_id):
+    """以 Server-Sent Events 流式返回LLM分析内容"""
+    if get_llm_job(job_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': '分析任务不存在或已过期'
+        }), 404
+    
+    def generate():
+        for event, payload in stream_llm_job(job_id):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """缓存命中统计，用于确认缓存是否生效"""
+    return jsonify({
+        'status': 'success',
+        'data': get_all_cache_stats()
+    })
+
+@app.route('/api/prefetch/status', methods=['GET'])
+def prefetch_status():
+    """后台预取的热门股票及最近一次预取时间"""
+    return jsonify({
+        'status': 'success',
+        'data': get_prefetch_status()
+    })
+
+@app.route('/api/upstream/status', methods=['GET'])
+def upstream_status():
+    """上游服务的熔断状态和当前限流速率"""
+    return jsonify({
+        'status': 'success',
+        'data': get_all_upstream_status()
+    })
+
 if __name__ == '__main__':
     logger.info('股票数据分析服务启动')
     app.run(debug=True) 
\ No newline at end of file
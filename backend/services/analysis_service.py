@@ -1,15 +1,18 @@
 import numpy as np
-import pandas as pd
 from scipy import stats
 import logging
+from services.bars import BarSeries
+from services.indicators import IndicatorEngine
+from services.levels import detect_levels
 
 logger = logging.getLogger(__name__)
 
 class StockAnalyzer:
     def __init__(self, data):
-        self.df = pd.DataFrame(data)
-        self.df['date'] = pd.to_datetime(self.df['date'])
-        self.df = self.df.sort_values('date')
+        if not isinstance(data, BarSeries):
+            data = BarSeries.from_records(sorted(data, key=lambda d: d['date']))
+        self.bars = data
+        self.indicators = IndicatorEngine(data)
 
     def analyze(self):
         """综合分析股票数据"""
@@ -35,7 +38,7 @@ class StockAnalyzer:
     def _analyze_trend(self):
         """分析价格趋势"""
         try:
-            closes = self.df['close'].values
+            closes = self.bars.close
             days = np.arange(len(closes))
             slope, intercept, r_value, p_value, std_err = stats.linregress(days, closes)
             
@@ -60,14 +63,15 @@ class StockAnalyzer:
     def _analyze_volatility(self):
         """分析波动性"""
         try:
-            returns = self.df['close'].pct_change().dropna()
-            volatility = returns.std() * np.sqrt(252)  # 年化波动率
+            volatility = self.indicators.volatility()  # 年化波动率
             
             # 计算波动区间
+            high = self.bars.high.max()
+            low = self.bars.low.min()
             price_range = {
-                'max': self.df['high'].max(),
-                'min': self.df['low'].min(),
-                'range_percent': (self.df['high'].max() - self.df['low'].min()) / self.df['low'].min() * 100
+                'max': high,
+                'min': low,
+                'range_percent': (high - low) / low * 100
             }
             
             return {
@@ -82,17 +86,20 @@ class StockAnalyzer:
     def _find_support_resistance(self):
         """寻找支撑位和阻力位"""
         try:
-            prices = self.df['close'].values
-            
-            # 使用简单的百分位数方法
-            support = np.percentile(prices, 25)
-            resistance = np.percentile(prices, 75)
-            
+            prices = self.bars.close
             current_price = prices[-1]
             
+            # 取当前价下方/上方最近的聚类价位，缺少时退回到区间最低/最高价
+            levels = detect_levels(self.bars)
+            supports = [level['price'] for level in levels if level['type'] == 'support']
+            resistances = [level['price'] for level in levels if level['type'] == 'resistance']
+            support = max(supports) if supports else self.bars.low.min()
+            resistance = min(resistances) if resistances else self.bars.high.max()
+            
             return {
                 'support': round(support, 2),
                 'resistance': round(resistance, 2),
+                'levels': levels,
                 'position': 'near_support' if current_price - support < (resistance - support) * 0.3 else 
                            'near_resistance' if resistance - current_price < (resistance - support) * 0.3 else
                            'middle_range'
@@ -104,22 +111,13 @@ class StockAnalyzer:
     def _analyze_technical_indicators(self):
         """分析技术指标"""
         try:
-            # 计算MACD
-            exp1 = self.df['close'].ewm(span=12, adjust=False).mean()
-            exp2 = self.df['close'].ewm(span=26, adjust=False).mean()
-            macd = exp1 - exp2
-            signal = macd.ewm(span=9, adjust=False).mean()
-            
-            # 计算RSI
-            delta = self.df['close'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
+            # 与基础分析共用同一套指标计算
+            macd = self.indicators.macd()
+            rsi = self.indicators.rsi()
             
             current_rsi = rsi.iloc[-1]
-            current_macd = macd.iloc[-1]
-            current_signal = signal.iloc[-1]
+            current_macd = macd['macd'].iloc[-1]
+            current_signal = macd['signal'].iloc[-1]
             
             return {
                 'macd': {
@@ -0,0 +1,269 @@
+import os
+import atexit
+import itertools
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from services.indicators import IndicatorEngine
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+MAX_COMBINATIONS = 200
+PROCESS_WORKERS = os.cpu_count() or 4
+# 回测任务量（参数组合数 × 股票数）不超过该值时直接在当前进程中计算
+INLINE_TASKS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# 默认参数按 StockAnalyzer / generate_action_advice 的规则设置；其中支撑/阻力位
+# 用区间分位数（support_quantile / resistance_quantile）近似，
+# 实际分析使用 detect_levels 的聚类价位，逐日重放代价过高
+DEFAULT_PARAMS = {
+    'strategy': 'analyzer',     # analyzer: StockAnalyzer 综合建议；advice: 操作建议
+    'trend_window': 250,        # 趋势回归窗口，对应默认 1y 数据
+    'trend_confidence': 0.7,
+    'rsi_period': 14,
+    'rsi_overbought': 70,
+    'rsi_oversold': 30,
+    'macd_fast': 12,
+    'macd_slow': 26,
+    'macd_signal': 9,
+    'range_window': 250,        # 支撑/阻力区间窗口
+    'support_quantile': 25,
+    'resistance_quantile': 75,
+    'near_range': 0.3,          # 距支撑/阻力小于区间宽度的该比例视为接近
+    'threshold': 0.5,           # 平均信号超过该值才买入/卖出
+    'strength_threshold': 0.7,  # advice 策略的趋势强度阈值
+    'volume_surge': 1.5,
+    'allow_short': False,
+    'cost': 0.001               # 每单位换手的交易成本
+}
+
+def analyzer_signals(bars, params):
+    """逐日重放 StockAnalyzer._generate_suggestion：1 买入，-1 卖出，0 观望"""
+    indicators = IndicatorEngine(bars)
+    close = bars.close
+
+    # 指标按参数缓存在 IndicatorEngine 中，参数扫描时同一进程内可复用
+    regression = indicators.trend(params['trend_window'])
+    slope, r_value = regression['slope'].to_numpy(), regression['r'].to_numpy()
+    confident = np.abs(r_value) > params['trend_confidence']
+    trend = np.where(confident, np.where(slope > 0, 1, -1), 0)
+
+    rsi = indicators.rsi(params['rsi_period']).to_numpy()
+    rsi_signal = np.where(rsi < params['rsi_oversold'], 1, np.where(rsi > params['rsi_overbought'], -1, 0))
+
+    macd = indicators.macd(params['macd_fast'], params['macd_slow'], params['macd_signal'])
+    macd_signal = np.where(macd['macd'].to_numpy() > macd['signal'].to_numpy(), 1, -1)
+
+    support = indicators.percentile(params['range_window'], params['support_quantile'])
+    resistance = indicators.percentile(params['range_window'], params['resistance_quantile'])
+    band = (resistance - support) * params['near_range']
+    position = np.where(close - support < band, 1, np.where(resistance - close < band, -1, 0))
+
+    signals = np.stack([trend, rsi_signal, macd_signal, position])
+    # MACD 每天都给出信号，因此参与平均的信号数至少为 1
+    average = signals.sum(axis=0) / np.count_nonzero(signals, axis=0)
+    return np.where(average > params['threshold'], 1, np.where(average < -params['threshold'], -1, 0))
+
+def advice_signals(bars, params):
+    """逐日重放 generate_action_advice 中的买卖建议"""
+    indicators = IndicatorEngine(bars)
+    close = bars.close
+    volume = bars.volume
+
+    # analyze_trend_strength：近20日上涨天数占比和相对 MA20 的偏离
+    up = np.concatenate([[0.0], (np.diff(close) > 0).astype(np.float64)])
+    consistency = (np.cumsum(up) - np.concatenate([np.zeros(20), np.cumsum(up)[:-20]])) / 20
+    ma20 = indicators.ma(20).to_numpy()
+    strength = (consistency + np.abs((close - ma20) / ma20)) / 2
+    rising = consistency > 0.5
+    strong = strength > params['strength_threshold']
+
+    # analyze_volume：近5日成交量 / 前5日成交量
+    total = np.concatenate([[0.0], np.cumsum(volume)])
+    recent = np.full(len(close), np.nan)
+    previous = np.full(len(close), np.nan)
+    recent[4:] = total[5:] - total[:-5]
+    previous[9:] = total[5:-5] - total[:-10]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        surge = recent / previous > params['volume_surge']
+
+    support = indicators.percentile(params['range_window'], params['support_quantile'])
+    near_support = np.abs(close - support) / close < 0.02
+
+    buy = (strong & rising).astype(int) + (surge & rising) + near_support
+    sell = (strong & ~rising).astype(int) + (surge & ~rising)
+    return np.sign(buy - sell)
+
+STRATEGIES = {
+    'analyzer': analyzer_signals,
+    'advice': advice_signals
+}
+
+def positions_from_signals(signals, allow_short=False):
+    """买入信号持有多头，卖出信号空仓（或做空），观望保持原仓位"""
+    target = np.where(signals > 0, 1.0, np.where(signals < 0, -1.0 if allow_short else 0.0, np.nan))
+    target = np.concatenate([[0.0], target])
+    # 向前填充观望日的仓位
+    last_set = np.maximum.accumulate(np.where(np.isnan(target), 0, np.arange(len(target))))
+    return target[last_set][1:]
+
+def evaluate(close, positions, cost):
+    """按收盘价成交计算收益、回撤、胜率和换手
+
+    第 t 天收盘根据信号调整仓位，持有到 t+1 天收盘。
+    """
+    returns = np.diff(close) / close[:-1]
+    held = positions[:-1]
+    trades = np.abs(np.diff(np.concatenate([[0.0], held])))
+    strategy = held * returns - trades * cost
+    equity = np.cumprod(1 + strategy)
+    drawdown = equity / np.maximum.accumulate(np.concatenate([[1.0], equity]))[1:] - 1
+
+    # 每段连续持有同一仓位视为一笔交易
+    segment = np.cumsum(trades > 0)
+    in_market = held != 0
+    trade_returns = np.expm1(np.bincount(
+        segment[in_market], weights=np.log1p(strategy[in_market]), minlength=segment[-1] + 1 if len(segment) else 0
+    ))
+    trade_ids = np.unique(segment[in_market])
+    trade_returns = trade_returns[trade_ids]
+
+    years = len(returns) / TRADING_DAYS
+    total_return = equity[-1] - 1 if len(equity) else 0.0
+    std = strategy.std(ddof=1) if len(strategy) > 1 else 0.0
+    return {
+        'total_return': float(total_return),
+        'annual_return': float((1 + total_return) ** (1 / years) - 1) if years > 0 and total_return > -1 else None,
+        'benchmark_return': float(close[-1] / close[0] - 1),
+        'sharpe': float(strategy.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else None,
+        'max_drawdown': float(drawdown.min()) if len(drawdown) else 0.0,
+        'trades': int(len(trade_returns)),
+        'hit_rate': float((trade_returns > 0).mean()) if len(trade_returns) else None,
+        'turnover': float(trades.sum()),
+        'annual_turnover': float(trades.sum() / years) if years > 0 else None,
+        'exposure': float(in_market.mean()) if len(in_market) else 0.0
+    }
+
+def resolve_params(params=None):
+    """合并默认参数并校验"""
+    resolved = dict(DEFAULT_PARAMS)
+    for name, value in (params or {}).items():
+        if name not in DEFAULT_PARAMS:
+            raise ValueError(f'不支持的回测参数: {name}')
+        resolved[name] = value
+    if resolved['strategy'] not in STRATEGIES:
+        raise ValueError(f'不支持的回测策略: {resolved["strategy"]}')
+    for name in ('trend_window', 'range_window', 'rsi_period', 'macd_fast', 'macd_slow', 'macd_signal'):
+        resolved[name] = int(resolved[name])
+        if resolved[name] < 2:
+            raise ValueError(f'回测参数 {name} 至少为 2')
+    return resolved
+
+def run_backtest(bars, params=None):
+    """对单只股票回测，返回绩效指标"""
+    params = resolve_params(params)
+    if len(bars) < 2:
+        raise ValueError('数据不足，无法回测')
+    signals = STRATEGIES[params['strategy']](bars, params)
+    positions = positions_from_signals(signals, params['allow_short'])
+    result = evaluate(bars.close, positions, float(params['cost']))
+    result['signals'] = {
+        'buy': int((signals > 0).sum()),
+        'sell': int((signals < 0).sum()),
+        'hold': int((signals == 0).sum())
+    }
+    result['start'] = str(bars.dates[0])
+    result['end'] = bars.last_date
+    return result
+
+def summarize(results):
+    """多只股票回测结果取平均（忽略缺失值）"""
+    fields = ['total_return', 'annual_return', 'benchmark_return', 'sharpe', 'max_drawdown',
+              'hit_rate', 'annual_turnover', 'exposure']
+    summary = {}
+    for field in fields:
+        values = [r[field] for r in results if r.get(field) is not None]
+        summary[field] = float(np.mean(values)) if values else None
+    summary['trades'] = int(sum(r['trades'] for r in results))
+    summary['symbols'] = len(results)
+    return summary
+
+def _run_combination(params, bars_by_symbol):
+    results = []
+    for bars in bars_by_symbol.values():
+        try:
+            results.append(run_backtest(bars, params))
+        except ValueError:
+            continue
+    return params, summarize(results)
+
+def _run_combinations(combinations, bars_by_symbol):
+    """子进程中依次回测一组参数组合，回测数据每组只序列化一次"""
+    return [_run_combination(params, bars_by_symbol) for params in combinations]
+
+def _get_pool():
+    """常驻的回测进程池，首次使用时创建，进程退出时关闭
+
+    Flask 进程是多线程的，fork 会复制其他线程持有的锁，因此子进程以 spawn 方式启动。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+def _reset_pool(pool):
+    """子进程异常退出后进程池不可再用，丢弃后下次重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def parameter_sweep(bars_by_symbol, grid, base_params=None, sort_by='sharpe'):
+    """参数扫描：对 grid 中每组参数组合在所有股票上回测，按 sort_by 降序返回
+
+    grid: {参数名: [取值, ...]}；参数组合按进程数分组，在常驻进程池中并行计算。
+    """
+    names = list(grid)
+    combinations = [
+        {**(base_params or {}), **dict(zip(names, values))}
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+    if len(combinations) > MAX_COMBINATIONS:
+        raise ValueError(f'参数组合过多（{len(combinations)}），最多{MAX_COMBINATIONS}组')
+    for params in combinations:
+        resolve_params(params)
+
+    if len(combinations) * len(bars_by_symbol) <= INLINE_TASKS:
+        outcomes = [_run_combination(params, bars_by_symbol) for params in combinations]
+    else:
+        pool = _get_pool()
+        size = -(-len(combinations) // PROCESS_WORKERS)
+        futures = [
+            pool.submit(_run_combinations, combinations[i:i + size], bars_by_symbol)
+            for i in range(0, len(combinations), size)
+        ]
+        try:
+            outcomes = [outcome for future in futures for outcome in future.result()]
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+    logger.info(f'参数扫描完成 - 组合数: {len(combinations)}, 股票数: {len(bars_by_symbol)}')
+
+    ranked = sorted(
+        outcomes,
+        key=lambda item: item[1].get(sort_by) if item[1].get(sort_by) is not None else -np.inf,
+        reverse=True
+    )
+    return [{'params': params, 'summary': summary} for params, summary in ranked]
@@ -0,0 +1,118 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+BAR_FIELDS = ['date', 'open', 'high', 'low', 'close', 'volume', 'change']
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'change']
+
+class BarSeries:
+    """列式K线序列
+
+    每列是一段连续的 numpy 数组（日期为 datetime64[D]，其余为 float64），
+    按日期升序排列。切片返回共享底层数组的视图，不复制数据；
+    只有在 Flask 返回 JSON 时才通过 to_records 转换为字典列表。
+    """
+
+    __slots__ = ('dates', 'open', 'high', 'low', 'close', 'volume', 'change', 'market', 'symbol')
+
+    def __init__(self, dates, open, high, low, close, volume, change=None, market=None, symbol=None):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        if change is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                change = (self.close - self.open) / self.open * 100
+        self.change = np.asarray(change, dtype=np.float64)
+        self.market = market
+        self.symbol = symbol
+
+    @classmethod
+    def empty(cls, market=None, symbol=None):
+        return cls([], [], [], [], [], [], [], market=market, symbol=symbol)
+
+    @classmethod
+    def from_records(cls, records, market=None, symbol=None):
+        """从字典列表（旧格式/JSON）构建"""
+        if not records:
+            return cls.empty(market, symbol)
+        columns = {field: [r[field] for r in records] for field in BAR_FIELDS}
+        return cls(columns['date'], columns['open'], columns['high'], columns['low'],
+                   columns['close'], columns['volume'], columns['change'],
+                   market=market, symbol=symbol)
+
+    @classmethod
+    def from_rows(cls, rows, market=None, symbol=None):
+        """从数据库查询结果 (date, open, high, low, close, volume, change) 构建"""
+        if not rows:
+            return cls.empty(market, symbol)
+        dates, opens, highs, lows, closes, volumes, changes = zip(*rows)
+        return cls(dates, opens, highs, lows, closes, volumes, changes, market=market, symbol=symbol)
+
+    @classmethod
+    def concat(cls, first, second):
+        """拼接两段K线序列（会复制数据）"""
+        return cls(
+            *(np.concatenate([getattr(first, name), getattr(second, name)])
+              for name in ['dates'] + PRICE_COLUMNS),
+            market=first.market, symbol=first.symbol
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, key):
+        """整数下标返回单根K线的字典，切片返回零拷贝视图"""
+        if isinstance(key, slice):
+            return BarSeries(
+                *(getattr(self, name)[key] for name in ['dates'] + PRICE_COLUMNS),
+                market=self.market, symbol=self.symbol
+            )
+        return {
+            'date': str(self.dates[key]),
+            **{name: float(getattr(self, name)[key]) for name in PRICE_COLUMNS}
+        }
+
+    @property
+    def last_date(self):
+        return str(self.dates[-1]) if len(self) else None
+
+    def since(self, date):
+        """date（含）之后的K线，零拷贝"""
+        return self[np.searchsorted(self.dates, np.datetime64(date, 'D'), side='left'):]
+
+    def until(self, date):
+        """date（含）之前的K线，零拷贝"""
+        return self[:np.searchsorted(self.dates, np.datetime64(date, 'D'), side='right')]
+
+    def tail(self, count):
+        return self[-count:] if count < len(self) else self
+
+    def content_hash(self, columns=PRICE_COLUMNS):
+        """日期和指定列的 SHA-1，用作缓存键的一部分：历史K线被修正或复权时也会改变"""
+        digest = hashlib.sha1(self.dates.tobytes())
+        for name in columns:
+            digest.update(getattr(self, name).tobytes())
+        return digest.hexdigest()
+
+    def date_strings(self):
+        return np.datetime_as_string(self.dates, unit='D')
+
+    def to_rows(self):
+        """转换为数据库写入所需的元组序列"""
+        return zip(self.date_strings().tolist(),
+                   *(getattr(self, name).tolist() for name in PRICE_COLUMNS))
+
+    def to_records(self):
+        """转换为字典列表，仅在返回 JSON 时使用"""
+        return [dict(zip(BAR_FIELDS, row)) for row in self.to_rows()]
+
+    def to_frame(self):
+        """转换为以日期为索引的 DataFrame"""
+        return pd.DataFrame(
+            {name: getattr(self, name) for name in PRICE_COLUMNS},
+            index=pd.DatetimeIndex(self.dates, name='date'),
+            copy=False
+        )
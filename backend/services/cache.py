@@ -0,0 +1,38 @@
+import threading
+
+class CacheStats:
+    """线程安全的缓存命中统计"""
+
+    def __init__(self, name, fields=('hit', 'miss', 'stale')):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters = {field: 0 for field in fields}
+
+    def incr(self, field, count=1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[field] = self._counters.get(field, 0) + count
+
+    def snapshot(self):
+        """返回当前计数及命中率"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters.get('hit', 0) + counters.get('miss', 0) + counters.get('stale', 0)
+        counters['hit_rate'] = round(counters.get('hit', 0) / lookups, 4) if lookups else 0
+        return counters
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get_cache_stats(name, fields=('hit', 'miss', 'stale')):
+    """获取（或创建）指定名称的缓存统计"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = CacheStats(name, fields)
+        return _registry[name]
+
+def get_all_cache_stats():
+    """汇总所有缓存的统计数据"""
+    with _registry_lock:
+        stats = list(_registry.values())
+    return {s.name: s.snapshot() for s in stats}
@@ -0,0 +1,90 @@
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from langchain_openai import ChatOpenAI
+from services.concurrency import MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# 连接池大小与共享线程池一致，保证每个工作线程都能复用一个长连接
+_settings = {
+    'proxy': os.environ.get('STOCK_HTTP_PROXY'),
+    'pool_size': MAX_WORKERS
+}
+_session = None
+_llm_clients = {}
+_lock = threading.Lock()
+
+def configure_clients(proxy=None, pool_size=None):
+    """配置代理地址和连接池大小，已创建的会话会在下次使用时重建"""
+    global _session
+    with _lock:
+        if proxy is not None:
+            _settings['proxy'] = proxy or None
+        if pool_size:
+            _settings['pool_size'] = pool_size
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def _create_session():
+    """创建带有代理、连接池和重试机制的会话"""
+    session = requests.Session()
+
+    # 设置代理
+    proxy = _settings['proxy']
+    if proxy:
+        session.proxies = {
+            'http': proxy,
+            'https': proxy
+        }
+
+    # 设置重试机制：只做一次快速重试，持续故障由 resilience 中的熔断器处理，
+    # 限流响应不按 Retry-After 阻塞等待，交给自适应令牌桶降速
+    retry_strategy = Retry(
+        total=1,
+        backoff_factor=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_settings['pool_size'],
+        pool_maxsize=_settings['pool_size'],
+        max_retries=retry_strategy
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    logger.info(f"创建共享HTTP会话 - 代理地址: {proxy or '无'}, 连接池大小: {_settings['pool_size']}")
+    return session
+
+def get_http_session():
+    """获取进程内共享的HTTP会话，复用长连接和TLS握手"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+def get_llm_client(model, api_base, api_key, temperature, timeout=None):
+    """获取长期复用的LLM客户端，按模型参数区分"""
+    key = (model, api_base, api_key, temperature, timeout)
+    client = _llm_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _llm_clients.get(key)
+            if client is None:
+                client = ChatOpenAI(
+                    model=model,
+                    openai_api_key=api_key,
+                    openai_api_base=api_base,
+                    temperature=temperature,
+                    timeout=timeout
+                )
+                _llm_clients[key] = client
+                logger.info(f'创建LLM客户端 - 模型: {model}')
+    return client
@@ -0,0 +1,43 @@
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 16  # 共享线程池大小，限制同时进行的远程调用数量
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='stage')
+
+def submit(fn, *args, **kwargs):
+    """提交任务到共享线程池，记录提交时间用于计算超时
+
+    任务在提交时的上下文中执行，请求的截止时间会随之传递。
+    """
+    future = _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    future.submitted_at = time.monotonic()
+    return future
+
+def submit_detached(fn, *args, **kwargs):
+    """提交不受当前请求截止时间约束的后台任务"""
+    return _executor.submit(fn, *args, **kwargs)
+
+def gather(futures, timeouts, default_timeout=30):
+    """等待多个阶段完成
+
+    每个阶段的超时从其提交时开始计算，超时或出错的阶段不会影响其他阶段。
+    返回 (results, errors)，errors 为 {阶段名: 原因}。
+    """
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        deadline = future.submitted_at + timeouts.get(name, default_timeout)
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            errors[name] = 'timeout'
+            logger.warning(f'阶段执行超时 - {name}')
+        except Exception as e:
+            errors[name] = str(e)
+            logger.error(f'阶段执行失败 - {name}: {str(e)}')
+    return results, errors
@@ -1,25 +1,28 @@
 import pandas as pd
-import numpy as np
 import logging
+from services.bars import BarSeries
+from services.indicators import IndicatorEngine
 
 logger = logging.getLogger(__name__)
 
 def analyze_stock_data(data):
     """
-    对股票数据进行基本分析
+    对股票数据进行基本分析，data 为 BarSeries
     """
     try:
-        df = pd.DataFrame(data)
-        logger.info(f'开始分析数据，数据点数: {len(df)}')
+        if not isinstance(data, BarSeries):
+            data = BarSeries.from_records(data)
+        indicators = IndicatorEngine(data)
+        logger.info(f'开始分析数据，数据点数: {len(data)}')
         
         analysis = {
             'moving_average': {
-                'MA5': calculate_ma(df, 5),
-                'MA20': calculate_ma(df, 20),
-                'MA60': calculate_ma(df, 60)
+                'MA5': calculate_ma(indicators, 5),
+                'MA20': calculate_ma(indicators, 20),
+                'MA60': calculate_ma(indicators, 60)
             },
-            'volatility': calculate_volatility(df),
-            'rsi': calculate_rsi(df)
+            'volatility': calculate_volatility(indicators),
+            'rsi': calculate_rsi(indicators)
         }
         
         # 处理 NaN 值
@@ -47,36 +50,32 @@ def analyze_stock_data(data):
         logger.error(f'数据分析失败: {str(e)}', exc_info=True)
         raise
 
-def calculate_ma(df, window):
+def calculate_ma(indicators, window):
     """计算移动平均"""
     try:
-        ma = df['close'].rolling(window=window, min_periods=1).mean()
+        ma = indicators.ma(window)
         logger.info(f'计算 MA{window} 完成')
         return ma.tolist()
     except Exception as e:
         logger.error(f'计算 MA{window} 失败: {str(e)}')
-        return [None] * len(df)
+        return [None] * len(indicators.bars)
 
-def calculate_volatility(df):
+def calculate_volatility(indicators):
     """计算波动率"""
     try:
-        volatility = df['close'].pct_change().std() * np.sqrt(252)
+        volatility = indicators.volatility()
         logger.info('计算波动率完成')
         return float(volatility) if pd.notnull(volatility) else 0
     except Exception as e:
         logger.error(f'计算波动率失败: {str(e)}')
         return 0
 
-def calculate_rsi(df, periods=14):
+def calculate_rsi(indicators, periods=14):
     """计算RSI指标"""
     try:
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=periods, min_periods=1).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=periods, min_periods=1).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
+        rsi = indicators.rsi(periods)
         logger.info('计算 RSI 完成')
         return rsi.tolist()
     except Exception as e:
         logger.error(f'计算 RSI 失败: {str(e)}')
-        return [None] * len(df) 
\ No newline at end of file
+        return [None] * len(indicators.bars) 
\ No newline at end of file
@@ -1,68 +1,663 @@
 import sqlite3
 import json
-from datetime import datetime
+import queue
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import logging
+import numpy as np
+from services.bars import BarSeries
+from services.indicators import IndicatorState
 
 logger = logging.getLogger(__name__)
 
+POOL_SIZE = 8              # 空闲连接池上限，超出的连接用完即关闭
+BUSY_TIMEOUT = 10          # 等待写锁的秒数
+CACHED_STATEMENTS = 256    # 每个连接缓存的预编译语句数量
+CACHE_SIZE_KB = 16 * 1024  # 每个连接的页缓存大小
+# 增量更新会从倒数第二根K线开始覆盖，指标状态只推进到这之前，
+# 读取时再在副本上补上最后几根K线
+STATE_LAG = 2
+
 class StockDatabase:
     def __init__(self, db_path='stock_data.db'):
         self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
         self.init_db()
     
+    def _connect(self):
+        """创建新连接并设置 WAL 等参数"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS
+        )
+        # WAL 模式下读写互不阻塞，NORMAL 同步级别在 WAL 下仍可保证数据库一致性
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """从连接池借出一个连接，在事务中使用后归还
+
+        连接长期复用，预编译语句缓存随连接保留；同一时刻每个连接只被一个线程持有。
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        reusable = True
+        try:
+            with conn:
+                yield conn
+        except sqlite3.DatabaseError:
+            # 连接可能已损坏，不再放回连接池
+            reusable = False
+            raise
+        finally:
+            try:
+                if not reusable:
+                    raise queue.Full
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """关闭连接池中的所有空闲连接"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
     def init_db(self):
         """初始化数据库表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                # 创建股票数据表
+                # K线数据表，每根K线一行
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS stock_data (
-                        symbol TEXT,
-                        market TEXT,
-                        data JSON,
+                    CREATE TABLE IF NOT EXISTS stock_bars (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        open REAL NOT NULL,
+                        high REAL NOT NULL,
+                        low REAL NOT NULL,
+                        close REAL NOT NULL,
+                        volume REAL NOT NULL,
+                        change REAL NOT NULL,
+                        PRIMARY KEY (market, symbol, date)
+                    ) WITHOUT ROWID
+                ''')
+                # 覆盖索引：按市场和日期读取全市场收盘价、成交量时无需回表
+                cursor.execute('DROP INDEX IF EXISTS idx_stock_bars_market_date')
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_stock_bars_market_date_close '
+                    'ON stock_bars (market, date, close, volume)'
+                )
+                # 每只股票的缓存元数据
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS stock_meta (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        period TEXT,
                         last_update TIMESTAMP,
-                        PRIMARY KEY (symbol, market)
+                        PRIMARY KEY (market, symbol)
+                    )
+                ''')
+                # 股票基本面信息
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS stock_info (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        info JSON NOT NULL,
+                        last_update TIMESTAMP NOT NULL,
+                        PRIMARY KEY (market, symbol)
+                    )
+                ''')
+                # LLM响应缓存，按提示输入的哈希寻址
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        model TEXT,
+                        response TEXT NOT NULL,
+                        created_at TIMESTAMP NOT NULL,
+                        last_access TIMESTAMP NOT NULL,
+                        hits INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)'
+                )
+                # 增量指标状态，as_of 为状态已包含的最后一根K线日期
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS indicator_state (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        as_of TEXT NOT NULL,
+                        state JSON NOT NULL,
+                        PRIMARY KEY (market, symbol)
+                    )
+                ''')
+                # 股票访问热度，后台预取任务据此选择需要预热的股票
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS symbol_activity (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        request_symbol TEXT NOT NULL,
+                        period TEXT NOT NULL,
+                        score REAL NOT NULL,
+                        last_access TIMESTAMP NOT NULL,
+                        PRIMARY KEY (market, symbol)
                     )
                 ''')
+                # 分析结果快照，K线指纹（首末日期、根数、最新收盘价、K线哈希）和分析版本一致时直接复用
+                columns = [row[1] for row in cursor.execute('PRAGMA table_info(analysis_snapshot)')]
+                if columns and 'bars_hash' not in columns:
+                    # 旧版快照缺少K线哈希，快照可随时重建，直接删除
+                    cursor.execute('DROP TABLE analysis_snapshot')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_snapshot (
+                        market TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        period TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        version INTEGER NOT NULL,
+                        first_date TEXT NOT NULL,
+                        last_date TEXT NOT NULL,
+                        bars INTEGER NOT NULL,
+                        last_close REAL NOT NULL,
+                        bars_hash TEXT NOT NULL,
+                        context TEXT NOT NULL,
+                        payload JSON NOT NULL,
+                        created_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (market, symbol, period, kind)
+                    ) WITHOUT ROWID
+                ''')
+                self._migrate_json_table(cursor)
                 conn.commit()
                 logger.info('数据库初始化成功')
         except Exception as e:
             logger.error(f'数据库初始化失败: {str(e)}', exc_info=True)
             raise
 
-    def get_stock_data(self, market, symbol):
-        """获取股票数据"""
+    def _migrate_json_table(self, cursor):
+        """将旧的 stock_data（整段 JSON）表迁移到 stock_bars"""
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'stock_data'"
+        )
+        if not cursor.fetchone():
+            return
+        
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(stock_data)')]
+        period_column = 'period' if 'period' in columns else 'NULL'
+        rows = cursor.execute(
+            f'SELECT symbol, market, data, last_update, {period_column} FROM stock_data'
+        ).fetchall()
+        
+        for symbol, market, data, last_update, period in rows:
+            try:
+                bars = json.loads(data) or []
+            except (TypeError, ValueError):
+                logger.warning(f'旧数据无法解析，跳过 - {market}:{symbol}')
+                continue
+            self._insert_bars(cursor, market, symbol, BarSeries.from_records(bars))
+            cursor.execute(
+                'INSERT OR REPLACE INTO stock_meta (market, symbol, period, last_update) VALUES (?, ?, ?, ?)',
+                (market, symbol, period, last_update)
+            )
+            self._update_indicator_state(cursor, market, symbol)
+        
+        cursor.execute('DROP TABLE stock_data')
+        logger.info(f'旧数据表迁移完成 - 股票数: {len(rows)}')
+
+    def get_stock_data(self, market, symbol, start=None, limit=None):
+        """获取股票数据，返回 (BarSeries, last_update, period)
+
+        start: 只返回该日期（含）之后的K线
+        limit: 只返回最近的 limit 根K线
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    'SELECT data, last_update FROM stock_data WHERE symbol = ? AND market = ?',
-                    (symbol, market)
+                    'SELECT period, last_update FROM stock_meta WHERE market = ? AND symbol = ?',
+                    (market, symbol)
+                )
+                result = cursor.fetchone()
+                if not result:
+                    return None, None, None
+                period, last_update = result
+                
+                query = '''
+                    SELECT date, open, high, low, close, volume, change FROM stock_bars
+                    WHERE market = ? AND symbol = ? AND date >= ?
+                    ORDER BY date DESC
+                '''
+                params = [market, symbol, start or '']
+                if limit:
+                    query += ' LIMIT ?'
+                    params.append(limit)
+                rows = cursor.execute(query, params).fetchall()
+                rows.reverse()
+                
+                data = BarSeries.from_rows(rows, market=market, symbol=symbol)
+                last_update = datetime.fromisoformat(last_update) if last_update else None
+                logger.info(f'从数据库获取数据成功 - {market}:{symbol}, 数据点数: {len(data)}, 最后更新: {last_update}')
+                return data, last_update, period
+        except Exception as e:
+            logger.error(f'从数据库获取数据失败: {str(e)}', exc_info=True)
+            return None, None, None
+
+    def save_stock_data(self, market, symbol, data, period=None):
+        """保存（全量替换）股票数据，period 记录本次数据覆盖的时间范围"""
+        try:
+            with self._connection() as conn:
+                self._replace_bars(conn.cursor(), market, symbol, data, period)
+                conn.commit()
+                logger.info(f'数据保存到数据库成功 - {market}:{symbol}')
+        except Exception as e:
+            logger.error(f'保存数据到数据库失败: {str(e)}', exc_info=True)
+            raise
+
+    def append_stock_data(self, market, symbol, rows):
+        """追加（或覆盖同日期及之后的）股票数据，只写入新的K线"""
+        try:
+            with self._connection() as conn:
+                self._append_bars(conn.cursor(), market, symbol, rows)
+                conn.commit()
+                logger.info(f'增量数据保存成功 - {market}:{symbol}, 数据点数: {len(rows)}')
+        except Exception as e:
+            logger.error(f'增量保存数据失败: {str(e)}', exc_info=True)
+            raise
+
+    def save_stock_data_batch(self, market, replacements, appends, period=None):
+        """在一个事务内批量保存多只股票
+
+        replacements: {symbol: BarSeries}，全量替换
+        appends: {symbol: BarSeries}，增量追加（可为空序列，只更新检查时间）
+        """
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                for symbol, data in replacements.items():
+                    self._replace_bars(cursor, market, symbol, data, period)
+                for symbol, rows in appends.items():
+                    self._append_bars(cursor, market, symbol, rows)
+                conn.commit()
+                logger.info(f'批量保存数据成功 - 市场: {market}, 全量: {len(replacements)}, 增量: {len(appends)}')
+        except Exception as e:
+            logger.error(f'批量保存数据失败: {str(e)}', exc_info=True)
+            raise
+
+    def touch_stock_data(self, market, symbol):
+        """没有新数据时只更新检查时间"""
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    'UPDATE stock_meta SET last_update = ? WHERE market = ? AND symbol = ?',
+                    (datetime.now().isoformat(), market, symbol)
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error(f'更新检查时间失败: {str(e)}', exc_info=True)
+            raise
+
+    def get_market_version(self, market):
+        """市场内已存储股票的数量和最后更新时间，用于判断全市场数据是否变化"""
+        try:
+            with self._connection() as conn:
+                return conn.execute(
+                    'SELECT COUNT(*), MAX(last_update) FROM stock_meta WHERE market = ?',
+                    (market,)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f'读取市场数据版本失败: {str(e)}', exc_info=True)
+            return None
+
+    def get_updated_symbols(self, market, since):
+        """last_update 不早于 since 的股票代码"""
+        try:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    'SELECT symbol FROM stock_meta WHERE market = ? AND last_update >= ?',
+                    (market, since)
+                ).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f'读取更新股票列表失败: {str(e)}', exc_info=True)
+            return []
+
+    def get_market_bars(self, market, days, symbols=None):
+        """读取市场内股票最近 days 个自然日（以全市场最新日期为准）的收盘价和成交量
+
+        symbols 为空时读取全部股票。返回 (symbols, dates, close, volume) 四个未排序的 numpy 数组
+        """
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT MAX(date) FROM stock_bars WHERE market = ?', (market,))
+                last_date = cursor.fetchone()[0]
+                if not last_date:
+                    return None
+                start = (datetime.fromisoformat(last_date) - timedelta(days=days)).date().isoformat()
+                query = 'SELECT symbol, date, close, volume FROM stock_bars WHERE market = ? AND date >= ?'
+                if symbols is None:
+                    rows = cursor.execute(query, (market, start)).fetchall()
+                else:
+                    rows = []
+                    symbols = list(symbols)
+                    # 分批绑定参数，避免超过 SQLite 的参数数量上限
+                    for i in range(0, len(symbols), 500):
+                        chunk = symbols[i:i + 500]
+                        placeholders = ', '.join('?' * len(chunk))
+                        rows += cursor.execute(
+                            query + f' AND symbol IN ({placeholders})', (market, start, *chunk)
+                        ).fetchall()
+                if not rows:
+                    return None
+                symbols, dates, close, volume = zip(*rows)
+                logger.info(f'读取全市场K线成功 - 市场: {market}, 数据点数: {len(rows)}')
+                return (
+                    np.array(symbols),
+                    np.array(dates, dtype='datetime64[D]'),
+                    np.array(close, dtype=np.float64),
+                    np.array(volume, dtype=np.float64)
+                )
+        except Exception as e:
+            logger.error(f'读取全市场K线失败: {str(e)}', exc_info=True)
+            return None
+
+    def get_stock_info(self, market, symbol):
+        """获取股票基本面信息，返回 (info, last_update)"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT info, last_update FROM stock_info WHERE market = ? AND symbol = ?',
+                    (market, symbol)
                 )
                 result = cursor.fetchone()
                 if result:
-                    data, last_update = result
-                    last_update = datetime.fromisoformat(last_update)
-                    logger.info(f'从数据库获取数据成功 - {market}:{symbol}, 最后更新: {last_update}')
-                    return json.loads(data), last_update
+                    info, last_update = result
+                    return json.loads(info), datetime.fromisoformat(last_update)
                 return None, None
         except Exception as e:
-            logger.error(f'从数据库获取数据失败: {str(e)}', exc_info=True)
+            logger.error(f'从数据库获取基本面信息失败: {str(e)}', exc_info=True)
             return None, None
 
-    def save_stock_data(self, market, symbol, data):
-        """保存股票数据"""
+    def save_stock_info(self, market, symbol, info):
+        """保存股票基本面信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with self._connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO stock_info (market, symbol, info, last_update)
+                    VALUES (?, ?, ?, ?)
+                ''', (market, symbol, json.dumps(info, ensure_ascii=False), datetime.now().isoformat()))
+                conn.commit()
+                logger.info(f'基本面信息保存成功 - {market}:{symbol}')
+        except Exception as e:
+            logger.error(f'保存基本面信息失败: {str(e)}', exc_info=True)
+
+    def get_symbol_activity(self, since):
+        """读取 last_access 不早于 since 的股票访问记录"""
+        try:
+            with self._connection() as conn:
+                rows = conn.execute('''
+                    SELECT market, symbol, request_symbol, period, score, last_access
+                    FROM symbol_activity WHERE last_access >= ?
+                ''', (since.isoformat(),)).fetchall()
+                return [
+                    {
+                        'market': market,
+                        'symbol': symbol,
+                        'request_symbol': request_symbol,
+                        'period': period,
+                        'score': score,
+                        'last_access': datetime.fromisoformat(last_access)
+                    }
+                    for market, symbol, request_symbol, period, score, last_access in rows
+                ]
+        except Exception as e:
+            logger.error(f'读取股票访问记录失败: {str(e)}', exc_info=True)
+            return []
+
+    def save_symbol_activity(self, activities, expire_before=None):
+        """批量保存股票访问记录，并删除 expire_before 之前的记录"""
+        try:
+            with self._connection() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO symbol_activity
+                    (market, symbol, request_symbol, period, score, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (a['market'], a['symbol'], a['request_symbol'], a['period'], a['score'],
+                     a['last_access'].isoformat())
+                    for a in activities
+                ])
+                if expire_before is not None:
+                    conn.execute(
+                        'DELETE FROM symbol_activity WHERE last_access < ?', (expire_before.isoformat(),)
+                    )
+                conn.commit()
+        except Exception as e:
+            logger.error(f'保存股票访问记录失败: {str(e)}', exc_info=True)
+
+    def get_analysis_snapshots(self, market, period, kind, symbols):
+        """批量读取分析快照，返回 {symbol: (指纹, payload JSON 文本)}，payload 由调用方按需解析"""
+        try:
+            with self._connection() as conn:
+                snapshots = {}
+                symbols = list(symbols)
+                for i in range(0, len(symbols), 500):
+                    chunk = symbols[i:i + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows = conn.execute(f'''
+                        SELECT symbol, version, first_date, last_date, bars, last_close, bars_hash, context, payload
+                        FROM analysis_snapshot
+                        WHERE market = ? AND period = ? AND kind = ? AND symbol IN ({placeholders})
+                    ''', (market, period, kind, *chunk)).fetchall()
+                    for symbol, version, first_date, last_date, bars, last_close, bars_hash, context, payload in rows:
+                        snapshots[symbol] = ({
+                            'version': version,
+                            'first_date': first_date,
+                            'last_date': last_date,
+                            'bars': bars,
+                            'last_close': last_close,
+                            'bars_hash': bars_hash,
+                            'context': context
+                        }, payload)
+                return snapshots
+        except Exception as e:
+            logger.error(f'读取分析快照失败: {str(e)}', exc_info=True)
+            return {}
+
+    def save_analysis_snapshots(self, snapshots):
+        """在一个事务中批量保存分析快照，snapshots 为 (market, symbol, period, kind, 指纹, payload) 列表"""
+        try:
+            with self._connection() as conn:
                 now = datetime.now().isoformat()
+                conn.executemany('''
+                    INSERT OR REPLACE INTO analysis_snapshot
+                    (market, symbol, period, kind, version, first_date, last_date, bars, last_close,
+                     bars_hash, context, payload, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (market, symbol, period, kind, fp['version'], fp['first_date'], fp['last_date'],
+                     fp['bars'], fp['last_close'], fp['bars_hash'], fp['context'], json.dumps(payload, ensure_ascii=False), now)
+                    for market, symbol, period, kind, fp, payload in snapshots
+                ])
+                conn.commit()
+                logger.info(f'分析快照保存成功 - 数量: {len(snapshots)}')
+        except Exception as e:
+            logger.error(f'保存分析快照失败: {str(e)}', exc_info=True)
+
+    def get_llm_response(self, cache_key, max_age):
+        """读取未过期的LLM缓存响应，max_age 为 timedelta"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                now = datetime.now()
+                cursor.execute(
+                    'SELECT response FROM llm_cache WHERE cache_key = ? AND created_at >= ?',
+                    (cache_key, (now - max_age).isoformat())
+                )
+                result = cursor.fetchone()
+                if not result:
+                    return None
+                cursor.execute(
+                    'UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?',
+                    (now.isoformat(), cache_key)
+                )
+                conn.commit()
+                return result[0]
+        except Exception as e:
+            logger.error(f'读取LLM缓存失败: {str(e)}', exc_info=True)
+            return None
+
+    def save_llm_response(self, cache_key, model, response, max_age, max_entries):
+        """保存LLM响应，并清理过期及超出容量（按最近访问时间淘汰）的缓存"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                now = datetime.now()
                 cursor.execute('''
-                    INSERT OR REPLACE INTO stock_data (symbol, market, data, last_update)
-                    VALUES (?, ?, ?, ?)
-                ''', (symbol, market, json.dumps(data), now))
+                    INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_access, hits)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                ''', (cache_key, model, response, now.isoformat(), now.isoformat()))
+                cursor.execute(
+                    'DELETE FROM llm_cache WHERE created_at < ?',
+                    ((now - max_age).isoformat(),)
+                )
+                cursor.execute('''
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (max_entries,))
                 conn.commit()
-                logger.info(f'数据保存到数据���成功 - {market}:{symbol}')
         except Exception as e:
-            logger.error(f'保存数据到数据库失败: {str(e)}', exc_info=True)
-            raise 
\ No newline at end of file
+            logger.error(f'保存LLM缓存失败: {str(e)}', exc_info=True)
+
+    def get_latest_indicators(self, market, symbol):
+        """读取最后一根K线的指标值，只需加载持久化的状态和最近几根K线"""
+        return self.get_latest_indicators_batch(market, [symbol]).get(symbol)
+
+    def get_latest_indicators_batch(self, market, symbols=None):
+        """批量读取最后一根K线的指标值，返回 {symbol: 指标}
+
+        状态已在写入K线时推进，这里只需在状态上补上 as_of 之后的几根K线，
+        代价与股票数成正比，与历史长度无关。symbols 为空时读取全市场。
+        """
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                states = {}
+                bars = {}
+                if symbols is None:
+                    chunks = [None]
+                else:
+                    symbols = list(symbols)
+                    chunks = [symbols[i:i + 500] for i in range(0, len(symbols), 500)]
+                for chunk in chunks:
+                    filter_sql, params = '', ()
+                    if chunk is not None:
+                        # 分批绑定参数，避免超过 SQLite 的参数数量上限
+                        filter_sql = f' AND symbol IN ({", ".join("?" * len(chunk))})'
+                        params = tuple(chunk)
+                    rows = cursor.execute(
+                        'SELECT symbol, as_of, state FROM indicator_state WHERE market = ?' + filter_sql,
+                        (market, *params)
+                    ).fetchall()
+                    if not rows:
+                        continue
+                    for symbol, as_of, state in rows:
+                        states[symbol] = (IndicatorState.from_dict(json.loads(state)), as_of)
+                    since = min(as_of for _, as_of, _ in rows)
+                    for row in cursor.execute(
+                        'SELECT symbol, date, open, high, low, close, volume, change FROM stock_bars '
+                        'WHERE market = ? AND date > ?' + filter_sql + ' ORDER BY symbol, date',
+                        (market, since, *params)
+                    ):
+                        bars.setdefault(row[0], []).append(row[1:])
+
+                results = {}
+                for symbol, (state, as_of) in states.items():
+                    rows = [row for row in bars.get(symbol, []) if row[0] > as_of]
+                    results[symbol] = state.advance(BarSeries.from_rows(rows)).values()
+                return results
+        except Exception as e:
+            logger.error(f'读取指标状态失败: {str(e)}', exc_info=True)
+            return {}
+
+    def _load_indicator_state(self, cursor, market, symbol):
+        cursor.execute(
+            'SELECT as_of, state FROM indicator_state WHERE market = ? AND symbol = ?',
+            (market, symbol)
+        )
+        result = cursor.fetchone()
+        if not result:
+            return None, None
+        as_of, state = result
+        return IndicatorState.from_dict(json.loads(state)), as_of
+
+    def _update_indicator_state(self, cursor, market, symbol, since=None):
+        """用 as_of 之后的新K线推进指标状态
+
+        since 为本次被覆盖的最早日期，若状态已包含该日期则从头重建。
+        """
+        state, as_of = self._load_indicator_state(cursor, market, symbol)
+        if state is None or (since is not None and as_of >= since):
+            state, as_of = IndicatorState(), ''
+        rows = cursor.execute('''
+            SELECT date, open, high, low, close, volume, change FROM stock_bars
+            WHERE market = ? AND symbol = ? AND date > ?
+            ORDER BY date
+        ''', (market, symbol, as_of)).fetchall()
+        settled = BarSeries.from_rows(rows[:-STATE_LAG])
+        if not len(settled):
+            return
+        state.advance(settled)
+        cursor.execute('''
+            INSERT OR REPLACE INTO indicator_state (market, symbol, as_of, state)
+            VALUES (?, ?, ?, ?)
+        ''', (market, symbol, state.last_date, json.dumps(state.to_dict())))
+
+    def _replace_bars(self, cursor, market, symbol, data, period):
+        cursor.execute(
+            'DELETE FROM stock_bars WHERE market = ? AND symbol = ?',
+            (market, symbol)
+        )
+        cursor.execute(
+            'DELETE FROM indicator_state WHERE market = ? AND symbol = ?',
+            (market, symbol)
+        )
+        self._insert_bars(cursor, market, symbol, data)
+        self._update_indicator_state(cursor, market, symbol)
+        cursor.execute('''
+            INSERT OR REPLACE INTO stock_meta (market, symbol, period, last_update)
+            VALUES (?, ?, ?, ?)
+        ''', (market, symbol, period, datetime.now().isoformat()))
+
+    def _append_bars(self, cursor, market, symbol, rows):
+        if len(rows):
+            cursor.execute(
+                'DELETE FROM stock_bars WHERE market = ? AND symbol = ? AND date >= ?',
+                (market, symbol, str(rows.dates[0]))
+            )
+            self._insert_bars(cursor, market, symbol, rows)
+            self._update_indicator_state(cursor, market, symbol, since=str(rows.dates[0]))
+        cursor.execute(
+            'UPDATE stock_meta SET last_update = ? WHERE market = ? AND symbol = ?',
+            (datetime.now().isoformat(), market, symbol)
+        )
+
+    def _insert_bars(self, cursor, market, symbol, data):
+        cursor.executemany(
+            'INSERT OR REPLACE INTO stock_bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((market, symbol) + row for row in data.to_rows())
+        )
\ No newline at end of file
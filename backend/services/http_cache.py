@@ -0,0 +1,88 @@
+import gzip
+import json
+import hashlib
+import logging
+from datetime import datetime, date
+from zoneinfo import ZoneInfo
+from flask import Response
+from werkzeug.http import is_resource_modified
+from services.stock_service import MARKET_SESSIONS, SETTLE_DELAY
+from services.snapshots import fingerprint, analysis_context
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_SIZE = 1024  # 小于该字节数的响应不压缩
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5        # 兼顾压缩率和速度，适合动态生成的 JSON
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript')
+
+def bars_last_modified(data):
+    """最后一根K线的收盘结算时间；尚未结算（盘中）时返回 None，只使用 ETag"""
+    session = MARKET_SESSIONS.get(data.market, MARKET_SESSIONS['US'])
+    tz = ZoneInfo(session['tz'])
+    closed = datetime.combine(date.fromisoformat(data.last_date), session['close'], tz)
+    if closed + SETTLE_DELAY > datetime.now(tz):
+        return None
+    return closed
+
+def stock_validators(data, period, market_context=None):
+    """由K线指纹（含最后K线日期、全部K线的哈希和分析版本）及大盘指数计算 (ETag, Last-Modified)"""
+    context = ''
+    if market_context and market_context['analysis']:
+        context = analysis_context('market', market_context)
+    payload = json.dumps([data.market, data.symbol, period, fingerprint(data, context)], sort_keys=True)
+    etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return etag, bars_last_modified(data)
+
+def is_not_modified(request, etag, last_modified):
+    """客户端缓存是否仍然有效（If-None-Match 优先于 If-Modified-Since）"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def set_validators(response, etag, last_modified):
+    """设置缓存校验头，要求客户端每次使用前重新校验"""
+    # 压缩后的字节内容随编码变化，使用弱 ETag
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def not_modified_response(etag, last_modified):
+    """304 响应，不包含响应体"""
+    return set_validators(Response(status=304), etag, last_modified)
+
+def compress_response(request, response):
+    """按 Accept-Encoding 对较大的响应进行 brotli（已安装时优先）或 gzip 压缩"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,478 @@
+import threading
+import logging
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from services.cache import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 4096  # 内存中最多缓存的指标序列数量
+
+cache_stats = get_cache_stats('indicators', ('hit', 'miss'))
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def compute_ma(close, window):
+    """简单移动平均，数据不足窗口时按已有数据计算"""
+    return close.rolling(window=window, min_periods=1).mean()
+
+def compute_ema(close, span):
+    """指数移动平均"""
+    return close.ewm(span=span, adjust=False).mean()
+
+def compute_macd(close, fast=12, slow=26, signal=9):
+    """MACD，返回包含 macd、signal、histogram 三列的 DataFrame"""
+    macd = compute_ema(close, fast) - compute_ema(close, slow)
+    signal_line = macd.ewm(span=signal, adjust=False).mean()
+    return pd.DataFrame({
+        'macd': macd,
+        'signal': signal_line,
+        'histogram': macd - signal_line
+    })
+
+def compute_rsi(close, periods=14, method='sma'):
+    """RSI
+
+    method='sma'：涨跌幅取简单移动平均，数据不足周期时按已有数据计算；
+    method='wilder'：涨跌幅取 Wilder 平滑（alpha=1/periods）。
+    """
+    delta = close.diff()
+    if method == 'wilder':
+        gain = delta.clip(lower=0).ewm(alpha=1 / periods, adjust=False).mean()
+        loss = (-delta).clip(lower=0).ewm(alpha=1 / periods, adjust=False).mean()
+    else:
+        gain = (delta.where(delta > 0, 0)).rolling(window=periods, min_periods=1).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=periods, min_periods=1).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+def compute_boll(close, period=20, width=2):
+    """布林带，标准差取总体标准差，数据不足周期时为 NaN"""
+    rolling = close.rolling(window=period)
+    mid = rolling.mean()
+    std = rolling.std(ddof=0)
+    return pd.DataFrame({
+        'mid': mid,
+        'upper': mid + width * std,
+        'lower': mid - width * std
+    })
+
+def compute_kdj(high, low, close, period=9, k=3, d=3):
+    """KDJ，K、D 以 50 为初始值按 1/k、1/d 平滑"""
+    lowest = low.rolling(window=period, min_periods=1).min()
+    highest = high.rolling(window=period, min_periods=1).max()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = ((close - lowest) / (highest - lowest) * 100).fillna(50)
+    seed = pd.Series([50.0])
+    k_line = pd.concat([seed, rsv], ignore_index=True).ewm(alpha=1 / k, adjust=False).mean().iloc[1:]
+    d_line = pd.concat([seed, k_line], ignore_index=True).ewm(alpha=1 / d, adjust=False).mean().iloc[1:]
+    k_line.index = d_line.index = close.index
+    return pd.DataFrame({
+        'k': k_line,
+        'd': d_line,
+        'j': 3 * k_line - 2 * d_line
+    })
+
+def compute_rolling_percentile(values, window, q):
+    """滚动百分位数（线性插值，窗口不足时使用全部已有数据）
+
+    完整窗口用 np.partition 只取两个相邻的顺序统计量；前 window-1 个不完整窗口
+    右侧用 inf 填充后排序，再按各自的长度取值。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.empty(n)
+    head = min(window - 1, n)
+
+    if head:
+        column = np.arange(head)
+        prefix = np.where(column[None, :] <= column[:, None], values[:head][None, :], np.inf)
+        prefix.sort(axis=1)
+        rank = q / 100 * column
+        lower = np.floor(rank).astype(np.intp)
+        upper = np.ceil(rank).astype(np.intp)
+        low = np.take_along_axis(prefix, lower[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(prefix, upper[:, None], axis=1)[:, 0]
+        result[:head] = low + (high - low) * (rank - lower)
+
+    if n >= window:
+        rank = q / 100 * (window - 1)
+        lower, upper = int(np.floor(rank)), int(np.ceil(rank))
+        windows = np.partition(sliding_window_view(values, window), [lower, upper], axis=1)
+        result[head:] = windows[:, lower] + (windows[:, upper] - windows[:, lower]) * (rank - lower)
+    return result
+
+def compute_trend(close, window):
+    """滚动线性回归（窗口不足时使用全部已有数据），返回包含 slope、r 两列的 DataFrame
+
+    用累计和计算每个窗口的协方差和方差，整体为 O(N)。
+    """
+    n = len(close)
+    x = np.arange(n, dtype=np.float64)
+    y = np.asarray(close, dtype=np.float64)
+    y = y - y[0]  # 平移不影响斜率和相关系数，可以减小累计和的舍入误差
+    end = np.arange(1, n + 1)
+    start = np.maximum(0, end - window)
+
+    def window_sum(values):
+        total = np.concatenate([[0.0], np.cumsum(values)])
+        return total[end] - total[start]
+
+    count = (end - start).astype(np.float64)
+    sx, sy = window_sum(x), window_sum(y)
+    sxx, syy, sxy = window_sum(x * x), window_sum(y * y), window_sum(x * y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / count
+        var_x = sxx - sx * sx / count
+        var_y = syy - sy * sy / count
+        return pd.DataFrame({
+            'slope': cov / var_x,
+            'r': cov / np.sqrt(var_x * var_y)
+        })
+
+def compute_volatility(close):
+    """年化波动率，数据不足时为 NaN"""
+    return float(close.pct_change().std() * np.sqrt(252))
+
+# 前端可配置的指标及其默认参数，参数顺序即缓存键中的顺序
+INDICATOR_SPECS = {
+    'MA': {'period': 5},
+    'EMA': {'period': 12},
+    'MACD': {'fast': 12, 'slow': 26, 'signal': 9},
+    'RSI': {'period': 14},
+    'KDJ': {'period': 9, 'k': 3, 'd': 3},
+    'BOLL': {'period': 20, 'std': 2}
+}
+MAX_PARAM = 500
+
+def normalize_spec(spec):
+    """校验指标配置 {type, params}，返回 (type, 参数元组)"""
+    indicator_type = str(spec.get('type', '')).upper()
+    defaults = INDICATOR_SPECS.get(indicator_type)
+    if defaults is None:
+        raise ValueError(f'不支持的指标类型: {spec.get("type")}')
+    params = spec.get('params') or {}
+    values = []
+    for name, default in defaults.items():
+        value = params.get(name, default)
+        try:
+            value = float(value) if name == 'std' else int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{indicator_type} 参数 {name} 无效: {value}')
+        if not 0 < value <= MAX_PARAM:
+            raise ValueError(f'{indicator_type} 参数 {name} 超出范围: {value}')
+        values.append(value)
+    return indicator_type, tuple(values)
+
+def _to_list(series, digits=4):
+    """转换为 JSON 列表，NaN 转为 None"""
+    values = np.round(np.asarray(series, dtype=np.float64), digits)
+    return [None if np.isnan(x) else x for x in values.tolist()]
+
+# 指标只依赖这几列，其内容哈希计入缓存键
+KEY_COLUMNS = ('close', 'high', 'low')
+
+def series_key(bars):
+    """K线序列的缓存键：股票、起止日期、长度以及收盘价、最高价、最低价的内容哈希
+
+    盘中最后一根K线会不断更新，历史K线也可能被修正或复权，因此整段价格都计入键；
+    不同 period 的序列起点不同，指标前段的值也不同，因此起始日期和长度也计入。
+    """
+    if bars.symbol is None or not len(bars):
+        return None
+    return (bars.market, bars.symbol, str(bars.dates[0]), bars.last_date,
+            len(bars), bars.content_hash(KEY_COLUMNS))
+
+def clear_indicator_cache():
+    with _lock:
+        _cache.clear()
+
+class IndicatorEngine:
+    """共享的指标计算引擎
+
+    所有分析代码都通过它获取指标，每个指标序列按 (股票, 最后一根K线, 参数)
+    计算一次并缓存，返回的序列不应被修改。
+    """
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.close = pd.Series(bars.close, copy=False)
+        self._key = series_key(bars)
+
+    def _get(self, name, params, compute):
+        if self._key is None:
+            return compute()
+        key = self._key + (name, params)
+        with _lock:
+            value = _cache.get(key)
+            if value is not None:
+                _cache.move_to_end(key)
+        if value is not None:
+            cache_stats.incr('hit')
+            return value
+
+        cache_stats.incr('miss')
+        value = compute()
+        with _lock:
+            _cache[key] = value
+            while len(_cache) > MAX_ENTRIES:
+                _cache.popitem(last=False)
+        return value
+
+    def ma(self, window):
+        return self._get('ma', (window,), lambda: compute_ma(self.close, window))
+
+    def ema(self, span):
+        return self._get('ema', (span,), lambda: compute_ema(self.close, span))
+
+    def macd(self, fast=12, slow=26, signal=9):
+        return self._get('macd', (fast, slow, signal),
+                         lambda: compute_macd(self.close, fast, slow, signal))
+
+    def rsi(self, periods=14, method='sma'):
+        return self._get('rsi', (periods, method), lambda: compute_rsi(self.close, periods, method))
+
+    def boll(self, period=20, width=2):
+        return self._get('boll', (period, width), lambda: compute_boll(self.close, period, width))
+
+    def kdj(self, period=9, k=3, d=3):
+        return self._get('kdj', (period, k, d), lambda: compute_kdj(
+            pd.Series(self.bars.high, copy=False), pd.Series(self.bars.low, copy=False),
+            self.close, period, k, d
+        ))
+
+    def percentile(self, window, q):
+        return self._get('percentile', (window, q), lambda: compute_rolling_percentile(self.bars.close, window, q))
+
+    def trend(self, window):
+        return self._get('trend', (window,), lambda: compute_trend(self.bars.close, window))
+
+    def volatility(self):
+        return self._get('volatility', (), lambda: compute_volatility(self.close))
+
+    def compute(self, spec):
+        """按前端指标配置计算，返回 {type, params, values: {线名: 列表}}
+
+        转换后的结果同样按参数缓存，重复请求不再重新计算和序列化。
+        """
+        indicator_type, params = normalize_spec(spec)
+        values = self._get('output', (indicator_type, params), lambda: self._compute_output(indicator_type, params))
+        return {
+            'type': indicator_type,
+            'params': dict(zip(INDICATOR_SPECS[indicator_type], params)),
+            'values': values
+        }
+
+    def _compute_output(self, indicator_type, params):
+        if indicator_type == 'MA':
+            return {'ma': _to_list(self.ma(*params))}
+        if indicator_type == 'EMA':
+            return {'ema': _to_list(self.ema(*params))}
+        if indicator_type == 'RSI':
+            return {'rsi': _to_list(self.rsi(*params))}
+        if indicator_type == 'MACD':
+            frame = self.macd(*params)
+        elif indicator_type == 'KDJ':
+            frame = self.kdj(*params)
+        else:
+            frame = self.boll(*params)
+        return {name: _to_list(frame[name]) for name in frame.columns}
+
+class RollingMean:
+    """滚动均值（min_periods=1），每根K线 O(1) 更新"""
+
+    def __init__(self, window, values=None, total=0.0):
+        self.window = window
+        self.values = deque(values or [], maxlen=window)
+        self.total = total
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        return self.value
+
+    @property
+    def value(self):
+        return self.total / len(self.values) if self.values else None
+
+    def to_dict(self):
+        return {'window': self.window, 'values': list(self.values), 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['window'], state['values'], state['total'])
+
+class EMA:
+    """指数移动平均（adjust=False），第一个值作为初始值"""
+
+    def __init__(self, span, value=None):
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.value = value
+
+    def update(self, x):
+        self.value = x if self.value is None else self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+    def to_dict(self):
+        return {'span': self.span, 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['span'], state['value'])
+
+class WilderAverage:
+    """Wilder 平滑均值，等价于 alpha=1/periods 的指数平均"""
+
+    def __init__(self, periods, value=None):
+        self.periods = periods
+        self.value = value
+
+    def update(self, x):
+        self.value = x if self.value is None else self.value + (x - self.value) / self.periods
+        return self.value
+
+    def to_dict(self):
+        return {'periods': self.periods, 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['periods'], state['value'])
+
+class RunningVariance:
+    """Welford 算法的累计方差（ddof=1）"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['count'], state['mean'], state['m2'])
+
+def _rsi_value(gain, loss):
+    if gain is None or loss is None or (gain == 0 and loss == 0):
+        return None
+    if loss == 0:
+        return 100.0
+    return 100 - 100 / (1 + gain / loss)
+
+class IndicatorState:
+    """可持久化的增量指标状态
+
+    与 IndicatorEngine 的默认参数一致：MA5/MA20/MA60、EMA12/EMA26/MACD(9)、
+    RSI14（简单平均与 Wilder 平滑）以及收益率的累计方差（年化波动率）。
+    每根新K线只需 update 一次，结果与全量计算最后一根的值一致。
+    """
+
+    MA_WINDOWS = (5, 20, 60)
+    RSI_PERIODS = 14
+
+    def __init__(self):
+        self.last_date = None
+        self.last_close = None
+        self.ma = {window: RollingMean(window) for window in self.MA_WINDOWS}
+        self.ema_fast = EMA(12)
+        self.ema_slow = EMA(26)
+        self.macd_signal = EMA(9)
+        self.rsi_gain = RollingMean(self.RSI_PERIODS)
+        self.rsi_loss = RollingMean(self.RSI_PERIODS)
+        self.wilder_gain = WilderAverage(self.RSI_PERIODS)
+        self.wilder_loss = WilderAverage(self.RSI_PERIODS)
+        self.returns = RunningVariance()
+
+    def update(self, date, close):
+        """推进一根K线"""
+        if self.last_close is None:
+            delta = 0.0
+        else:
+            delta = close - self.last_close
+            self.returns.update(delta / self.last_close)
+            # 第一根K线没有涨跌，不参与 Wilder 平滑
+            self.wilder_gain.update(max(delta, 0.0))
+            self.wilder_loss.update(max(-delta, 0.0))
+        self.rsi_gain.update(max(delta, 0.0))
+        self.rsi_loss.update(max(-delta, 0.0))
+
+        for ma in self.ma.values():
+            ma.update(close)
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        self.macd_signal.update(macd)
+
+        self.last_date = date
+        self.last_close = close
+
+    def advance(self, bars):
+        """依次推进一段K线"""
+        for date, close in zip(bars.date_strings().tolist(), bars.close.tolist()):
+            self.update(date, close)
+        return self
+
+    def values(self):
+        """当前（最后一根K线）的指标值"""
+        if self.last_close is None:
+            return None
+        macd = self.ema_fast.value - self.ema_slow.value
+        std = self.returns.std
+        return {
+            'date': self.last_date,
+            'close': self.last_close,
+            **{f'ma{window}': ma.value for window, ma in self.ma.items()},
+            'ema12': self.ema_fast.value,
+            'ema26': self.ema_slow.value,
+            'macd': macd,
+            'macd_signal': self.macd_signal.value,
+            'macd_histogram': macd - self.macd_signal.value,
+            'rsi': _rsi_value(self.rsi_gain.value, self.rsi_loss.value),
+            'rsi_wilder': _rsi_value(self.wilder_gain.value, self.wilder_loss.value),
+            'volatility': std * np.sqrt(252) if std is not None else None
+        }
+
+    def to_dict(self):
+        return {
+            'last_date': self.last_date,
+            'last_close': self.last_close,
+            'ma': [ma.to_dict() for ma in self.ma.values()],
+            'ema_fast': self.ema_fast.to_dict(),
+            'ema_slow': self.ema_slow.to_dict(),
+            'macd_signal': self.macd_signal.to_dict(),
+            'rsi_gain': self.rsi_gain.to_dict(),
+            'rsi_loss': self.rsi_loss.to_dict(),
+            'wilder_gain': self.wilder_gain.to_dict(),
+            'wilder_loss': self.wilder_loss.to_dict(),
+            'returns': self.returns.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        obj = cls()
+        obj.last_date = state['last_date']
+        obj.last_close = state['last_close']
+        obj.ma = {ma['window']: RollingMean.from_dict(ma) for ma in state['ma']}
+        obj.ema_fast = EMA.from_dict(state['ema_fast'])
+        obj.ema_slow = EMA.from_dict(state['ema_slow'])
+        obj.macd_signal = EMA.from_dict(state['macd_signal'])
+        obj.rsi_gain = RollingMean.from_dict(state['rsi_gain'])
+        obj.rsi_loss = RollingMean.from_dict(state['rsi_loss'])
+        obj.wilder_gain = WilderAverage.from_dict(state['wilder_gain'])
+        obj.wilder_loss = WilderAverage.from_dict(state['wilder_loss'])
+        obj.returns = RunningVariance.from_dict(state['returns'])
+        return obj
@@ -0,0 +1,262 @@
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from services.bars import BarSeries
+
+logger = logging.getLogger(__name__)
+
+RESOLUTION = 0.005  # 价格分箱的相对宽度（对数刻度，0.5%）
+PIVOT_WINDOW = 5    # 摆动高/低点左右各需要的K线数
+SMOOTHING = 2       # 核密度平滑的标准差（分箱数）
+MAX_LEVELS = 6
+MAX_DETECTORS = 1024  # 缓存的检测器数量上限（按最近使用淘汰）
+# 增量更新会覆盖最后两根K线，检测器只消费这之前的K线，查询时再补上
+SETTLE_LAG = 2
+# 检测器用到的列，复用前比较这些列在重叠区间的内容
+DETECTOR_COLUMNS = ('high', 'low', 'volume')
+
+_detectors = OrderedDict()
+_lock = threading.Lock()
+
+def find_pivots(high, low, window=PIVOT_WINDOW):
+    """向量化寻找摆动高点和低点
+
+    某根K线的最高价是左右各 window 根K线中的最大值（并列时取最早的一根）即为高点，
+    低点同理。返回 (高点下标, 低点下标)，只包含左右都有完整窗口的K线。
+    """
+    if len(high) < 2 * window + 1:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    span = 2 * window + 1
+    highs = np.flatnonzero(sliding_window_view(high, span).argmax(axis=1) == window) + window
+    lows = np.flatnonzero(sliding_window_view(low, span).argmin(axis=1) == window) + window
+    return highs, lows
+
+class LevelDetector:
+    """支撑/阻力位检测器
+
+    价格按对数刻度分箱（每箱宽 resolution），摆动高低点按成交量加权累加到直方图，
+    再用高斯核平滑（即对数价格上的核密度估计），密度的局部极大值即为价位。
+    每个分箱同时累计覆盖它的K线数（触及次数）。追加K线时只处理新K线和尚未确认的摆动点；
+    窗口起点后移时减去移出窗口的K线和摆动点，代价都与变化的数据量成正比，
+    结果与直接用当前窗口重新计算一致。
+    """
+
+    def __init__(self, resolution=RESOLUTION, window=PIVOT_WINDOW, smoothing=SMOOTHING):
+        self.resolution = resolution
+        self.window = window
+        self.smoothing = smoothing
+        self._log_step = np.log1p(resolution)
+        self._origin = None
+        self._weight = np.zeros(0)
+        self._weighted_price = np.zeros(0)
+        self._pivots = np.zeros(0, dtype=np.int64)
+        self._touches = np.zeros(0, dtype=np.int64)
+        # 已计入直方图的摆动点：在 _bars 中的下标、分箱、成交量和价格
+        self._pivot_index = np.zeros(0, dtype=np.int64)
+        self._pivot_bin = np.zeros(0, dtype=np.int64)
+        self._pivot_volume = np.zeros(0)
+        self._pivot_price = np.zeros(0)
+        self._bars = None
+        self._pending = 0
+        self.first_date = None
+        self.last_date = None
+
+    def _bins(self, prices):
+        return np.floor(np.log(prices) / self._log_step).astype(np.int64)
+
+    def _bin_price(self, bins):
+        return np.exp((bins + self._origin + 0.5) * self._log_step)
+
+    def _ensure_range(self, low_bin, high_bin):
+        """按需扩展直方图数组，使其覆盖 [low_bin, high_bin]"""
+        if self._origin is None:
+            self._origin = low_bin
+        before = max(0, self._origin - low_bin)
+        after = max(0, high_bin - self._origin + 1 - len(self._weight))
+        if before or after:
+            pad = (before, after)
+            self._weight = np.pad(self._weight, pad)
+            self._weighted_price = np.pad(self._weighted_price, pad)
+            self._pivots = np.pad(self._pivots, pad)
+            self._touches = np.pad(self._touches, pad)
+            self._pivot_bin = self._pivot_bin + before
+            self._origin -= before
+
+    def _add_touches(self, touches, bars, sign=1):
+        """每根K线对其最低价到最高价覆盖的分箱各计一次触及（sign=-1 时减去）"""
+        low_bins = self._bins(bars.low) - self._origin
+        high_bins = self._bins(bars.high) - self._origin
+        diff = np.zeros(len(touches) + 1, dtype=np.int64)
+        np.add.at(diff, low_bins, sign)
+        np.add.at(diff, high_bins + 1, -sign)
+        touches += np.cumsum(diff[:-1])
+
+    def slide(self, start):
+        """把窗口起点后移到 start，减去移出的K线及不再有完整左侧窗口的摆动点"""
+        if self._bars is None:
+            return self
+        drop = int(np.searchsorted(self._bars.dates, np.datetime64(start, 'D')))
+        if drop == 0:
+            return self
+        self._add_touches(self._touches, self._bars[:drop], sign=-1)
+
+        # 新窗口中下标小于 window 的K线左侧不完整，重新计算时不会被识别为摆动点
+        removed = self._pivot_index < drop + self.window
+        bins = self._pivot_bin[removed]
+        volumes = self._pivot_volume[removed]
+        np.subtract.at(self._weight, bins, volumes)
+        np.subtract.at(self._weighted_price, bins, volumes * self._pivot_price[removed])
+        np.subtract.at(self._pivots, bins, 1)
+        # 没有摆动点的分箱清零，避免浮点减法的残差
+        empty = self._pivots == 0
+        self._weight[empty] = 0
+        self._weighted_price[empty] = 0
+
+        kept = ~removed
+        self._pivot_index = self._pivot_index[kept] - drop
+        self._pivot_bin = self._pivot_bin[kept]
+        self._pivot_volume = self._pivot_volume[kept]
+        self._pivot_price = self._pivot_price[kept]
+        self._bars = self._bars[drop:]
+        self._pending = min(self._pending, len(self._bars))
+        self.first_date = str(self._bars.dates[0])
+        return self
+
+    def update(self, bars):
+        """追加新的K线（只处理 last_date 之后的部分）"""
+        if self.last_date is not None:
+            bars = bars[np.searchsorted(bars.dates, np.datetime64(self.last_date, 'D'), side='right'):]
+        if not len(bars):
+            return self
+
+        self._ensure_range(int(self._bins(bars.low.min())), int(self._bins(bars.high.max())))
+        self._add_touches(self._touches, bars)
+
+        # 拼上未确认的尾部K线后寻找新确认的摆动点
+        tail = self._bars.tail(2 * self.window) if self._bars is not None else None
+        combined = BarSeries.concat(tail, bars) if tail is not None else bars
+        offset = len(self._bars) - len(tail) if tail is not None else 0
+        highs, lows = find_pivots(combined.high, combined.low, self.window)
+        start = len(combined) - len(bars) - self._pending
+        for indices, prices in ((highs, combined.high), (lows, combined.low)):
+            indices = indices[indices >= start]
+            if not len(indices):
+                continue
+            pivot_prices = prices[indices]
+            pivot_bins = self._bins(pivot_prices) - self._origin
+            volumes = combined.volume[indices]
+            np.add.at(self._weight, pivot_bins, volumes)
+            np.add.at(self._weighted_price, pivot_bins, volumes * pivot_prices)
+            np.add.at(self._pivots, pivot_bins, 1)
+            self._pivot_index = np.concatenate([self._pivot_index, indices + offset])
+            self._pivot_bin = np.concatenate([self._pivot_bin, pivot_bins])
+            self._pivot_volume = np.concatenate([self._pivot_volume, volumes])
+            self._pivot_price = np.concatenate([self._pivot_price, pivot_prices])
+
+        self._pending = min(self.window, len(combined))
+        self._bars = BarSeries.concat(self._bars, bars) if self._bars is not None else bars
+        if self.first_date is None:
+            self.first_date = str(bars.dates[0])
+        self.last_date = bars.last_date
+        return self
+
+    def matches(self, bars):
+        """检测器已消费的数据是否仍与 bars 一致（未被修正、复权或全量替换）
+
+        bars 的起点不能早于检测器的起点；晚于时可通过 slide 后移窗口。
+        比较两者重叠区间（bars 起点到检测器的最后一根K线）的内容哈希。
+        """
+        if self.last_date is None or not len(bars):
+            return False
+        if np.datetime64(self.first_date, 'D') > bars.dates[0]:
+            return False
+        index = np.searchsorted(bars.dates, np.datetime64(self.last_date, 'D'))
+        if index >= len(bars) or str(bars.dates[index]) != self.last_date:
+            return False
+        consumed = self._bars.since(bars.dates[0])
+        return consumed.content_hash(DETECTOR_COLUMNS) == bars[:index + 1].content_hash(DETECTOR_COLUMNS)
+
+    def levels(self, current_price, recent=None, max_levels=MAX_LEVELS):
+        """返回按强度排序的价位列表
+
+        recent: 尚未被检测器消费的最新K线，只计入触及次数
+        """
+        if self._origin is None or not self._weight.any():
+            return []
+        touches = self._touches
+        if recent is not None and len(recent):
+            self._ensure_range(int(self._bins(recent.low.min())), int(self._bins(recent.high.max())))
+            touches = self._touches.copy()
+            self._add_touches(touches, recent)
+
+        radius = max(1, int(np.ceil(3 * self.smoothing)))
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 * (offsets / self.smoothing) ** 2)
+        density = np.convolve(self._weight, kernel, mode='same')
+        weighted_price = np.convolve(self._weighted_price, kernel, mode='same')
+
+        padded = np.concatenate([[-np.inf], density, [-np.inf]])
+        peaks = np.flatnonzero(
+            (density > padded[:-2]) & (density >= padded[2:]) & (density > 0)
+        )
+        if not len(peaks):
+            return []
+        peaks = peaks[np.argsort(density[peaks])[::-1][:max_levels]]
+
+        # 价位取峰值附近摆动点价格的加权平均，触及次数取该价位所在分箱
+        prices = weighted_price[peaks] / density[peaks]
+        level_bins = np.clip(self._bins(prices) - self._origin, 0, len(touches) - 1)
+        pivot_counts = np.convolve(self._pivots, np.ones(2 * radius + 1, dtype=np.int64), mode='same')
+        strength = density[peaks] / density[peaks].max()
+
+        return [
+            {
+                'price': round(float(price), 2),
+                'type': 'support' if price < current_price else 'resistance',
+                'strength': round(float(score), 3),
+                'touches': int(touch),
+                'pivots': int(pivots)
+            }
+            for price, score, touch, pivots in zip(
+                prices, strength, touches[level_bins], pivot_counts[peaks]
+            )
+        ]
+
+def detect_levels(bars, resolution=RESOLUTION, window=PIVOT_WINDOW,
+                  smoothing=SMOOTHING, max_levels=MAX_LEVELS):
+    """检测支撑/阻力位
+
+    同一股票和参数的检测器会被保留（最多 MAX_DETECTORS 个，按最近使用淘汰）：
+    新K线到来时增量追加，窗口起点后移时减去移出的数据，结果只取决于 bars 本身；
+    请求的起点早于检测器、数据被替换或复权时重建。没有股票代码的序列每次重新计算。
+    """
+    try:
+        if not len(bars):
+            return []
+        settled = bars[:-SETTLE_LAG] if len(bars) > SETTLE_LAG else bars[:0]
+        recent = bars[len(settled):]
+        current_price = float(bars.close[-1])
+
+        if bars.symbol is None:
+            detector = LevelDetector(resolution, window, smoothing).update(settled)
+            return detector.levels(current_price, recent, max_levels)
+
+        key = (bars.market, bars.symbol, resolution, window, smoothing)
+        with _lock:
+            detector = _detectors.get(key)
+            if detector is None or not detector.matches(settled):
+                detector = LevelDetector(resolution, window, smoothing)
+                _detectors[key] = detector
+                while len(_detectors) > MAX_DETECTORS:
+                    _detectors.popitem(last=False)
+            _detectors.move_to_end(key)
+            if len(settled):
+                detector.slide(settled.dates[0])
+            detector.update(settled)
+            return detector.levels(current_price, recent, max_levels)
+    except Exception as e:
+        logger.error(f'支撑阻力位检测失败: {str(e)}', exc_info=True)
+        return []
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from langchain.prompts import ChatPromptTemplate
+from services.stock_service import db
+from services.clients import get_llm_client
+from services.cache import get_cache_stats
+from services.resilience import get_upstream, deadline
+
+logger = logging.getLogger(__name__)
+cache_stats = get_cache_stats('llm', ('hit', 'miss', 'inflight', 'stale'))
+
+LLM_MODEL = "deepseek-chat"
+LLM_API_BASE = "https://api.deepseek.com/v1"
+LLM_WORKERS = 4       # 同时进行的LLM分析任务数
+JOB_TTL = 600         # 任务结果保留时间（秒）
+STREAM_TIMEOUT = 120  # 流式输出等待新内容的最长时间（秒）
+LLM_TEMPERATURE = 0.7
+LLM_CACHE_TTL = timedelta(hours=12)  # 相同输入的分析结果在一个交易日内复用
+LLM_CACHE_MAX_ENTRIES = 5000
+LLM_TIMEOUT = 90      # 单次分析（含等待限流令牌）的最长时间（秒）
+LLM_STALE_TTL = timedelta(days=7)  # 服务熔断时可返回的过期缓存范围
+
+# 分析提示模板
+PROMPT_TEMPLATE = """
+作为一个专业的股票分析师，请基于以下数据分析该股票的走势：
+
+最近的股票数据:
+{stock_data}
+
+技术指标数据:
+{technical_indicators}
+
+请提供以下分析：
+1. 总体趋势判断
+2. 主要支撑和阻力位
+3. 短期投资建议
+4. 需要关注的风险点
+
+请用专业的角度进行分析，并给出具体的数据支持。
+"""
+
+_prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix='llm')
+_jobs = {}
+_jobs_lock = threading.Lock()
+# DeepSeek 请求限流和熔断：熔断期间返回过期的缓存结果或直接失败
+llm_upstream = get_upstream('deepseek', rate=1, capacity=4, failure_threshold=3, reset_timeout=60)
+
+def _analysis_result(text):
+    return {
+        "llm_analysis": text,
+        "analysis_type": "AI智能分析",
+        "model": LLM_MODEL
+    }
+
+def create_analysis_chain():
+    """创建分析链（使用Deepseek模型，客户端在进程内复用）"""
+    llm = get_llm_client(
+        LLM_MODEL,
+        LLM_API_BASE,
+        os.environ.get("DEEPSEEK_API_KEY"),
+        LLM_TEMPERATURE,
+        LLM_TIMEOUT
+    )
+    return _prompt_template | llm
+
+def build_llm_inputs(stock_data, technical_analysis):
+    """准备提示模板的输入数据"""
+    # 准备输入数据
+    recent_data = stock_data[-5:].to_records()  # 最近5天数据
+    technical_indicators = {
+        'RSI': technical_analysis.get('rsi', [])[-1] if technical_analysis.get('rsi') else None,
+        'MA5': technical_analysis['moving_average']['MA5'][-1] if technical_analysis.get('moving_average') else None,
+        'MA20': technical_analysis['moving_average']['MA20'][-1] if technical_analysis.get('moving_average') else None,
+        'volatility': technical_analysis.get('volatility'),
+    }
+    
+    # 格式化数据为更易读的格式
+    formatted_data = []
+    for day in recent_data:
+        formatted_data.append({
+            '日期': day.get('date', ''),
+            '开盘': round(day.get('open', 0), 2),
+            '最高': round(day.get('high', 0), 2),
+            '最低': round(day.get('low', 0), 2),
+            '��盘': round(day.get('close', 0), 2),
+            '成交量': day.get('volume', 0)
+        })
+
+    formatted_indicators = {
+        'RSI指标': round(technical_indicators['RSI'], 2) if technical_indicators['RSI'] else None,
+        '5日均线': round(technical_indicators['MA5'], 2) if technical_indicators['MA5'] else None,
+        '20日均线': round(technical_indicators['MA20'], 2) if technical_indicators['MA20'] else None,
+        '波动率': f"{round(technical_indicators['volatility'] * 100, 2)}%" if technical_indicators['volatility'] else None
+    }
+    
+    return {
+        "stock_data": json.dumps(formatted_data, indent=2, ensure_ascii=False),
+        "technical_indicators": json.dumps(formatted_indicators, indent=2, ensure_ascii=False)
+    }
+
+def llm_cache_key(inputs):
+    """按模型、提示模板和输入内容计算缓存键"""
+    payload = json.dumps({
+        'model': LLM_MODEL,
+        'temperature': LLM_TEMPERATURE,
+        'template': PROMPT_TEMPLATE,
+        'inputs': inputs
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cached_result(cache_key, max_age=LLM_CACHE_TTL):
+    response = db.get_llm_response(cache_key, max_age)
+    if response is None:
+        return None
+    result = _analysis_result(response)
+    result.update({'job_id': cache_key, 'status': 'done', 'cached': True})
+    return result
+
+def submit_llm_analysis(stock_data, technical_analysis):
+    """提交后台LLM分析任务，立即返回任务信息
+
+    任务ID即输入内容的缓存键：相同输入直接返回缓存结果，
+    或复用正在执行的同一任务。
+    """
+    _prune_jobs()
+    inputs = build_llm_inputs(stock_data, technical_analysis)
+    cache_key = llm_cache_key(inputs)
+    
+    cached = _cached_result(cache_key)
+    if cached:
+        cache_stats.incr('hit')
+        logger.info(f"LLM分析命中缓存 - {cache_key}")
+        return cached
+    
+    if not llm_upstream.available():
+        # 服务熔断中，优先返回相同输入的过期结果，没有时任务会立即失败
+        stale = _cached_result(cache_key, LLM_STALE_TTL)
+        if stale:
+            cache_stats.incr('stale')
+            stale['stale'] = True
+            logger.info(f"LLM服务熔断中，返回过期缓存 - {cache_key}")
+            return stale
+    
+    with _jobs_lock:
+        existing = _jobs.get(cache_key)
+        if existing and existing['status'] in ('pending', 'running'):
+            cache_stats.incr('inflight')
+            return get_llm_job(cache_key)
+        cache_stats.incr('miss')
+        job = _new_job(cache_key)
+        _jobs[cache_key] = job
+    _executor.submit(_run_job, job, inputs)
+    logger.info(f"LLM分析任务已提交 - {job['job_id']}")
+    return get_llm_job(job['job_id'])
+
+def _new_job(job_id):
+    return {
+        'job_id': job_id,
+        'status': 'pending',
+        'chunks': [],
+        'result': None,
+        'created_at': time.time(),
+        'condition': threading.Condition()
+    }
+
+def _run_job(job, inputs):
+    condition = job['condition']
+    with condition:
+        job['status'] = 'running'
+    try:
+        chain = create_analysis_chain()
+        with deadline(LLM_TIMEOUT), llm_upstream.guard():
+            for chunk in chain.stream(inputs):
+                if chunk.content:
+                    with condition:
+                        job['chunks'].append(chunk.content)
+                        condition.notify_all()
+        
+        response = ''.join(job['chunks'])
+        logger.info(f"AI分析响应: {response}")
+        if response:
+            db.save_llm_response(job['job_id'], LLM_MODEL, response, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+        result = _analysis_result(response or "AI分析服务暂时不可用，请稍后重试。")
+        status = 'done'
+    except Exception as e:
+        logger.error(f"LLM分析失败: {str(e)}", exc_info=True)
+        result = _analysis_result(f"AI分析生成失败: {str(e)}")
+        status = 'error'
+    
+    with condition:
+        job['result'] = result
+        job['status'] = status
+        condition.notify_all()
+
+def _prune_jobs():
+    """清理过期的任务"""
+    expired_before = time.time() - JOB_TTL
+    with _jobs_lock:
+        for job_id in [k for k, job in _jobs.items() if job['created_at'] < expired_before]:
+            del _jobs[job_id]
+
+def get_llm_job(job_id):
+    """查询任务状态，未完成时 llm_analysis 为已生成的部分内容"""
+    job = _jobs.get(job_id)
+    if job is None:
+        # 任务已过期时从响应缓存中读取
+        return _cached_result(job_id)
+    with job['condition']:
+        if job['result']:
+            payload = dict(job['result'])
+        else:
+            payload = _analysis_result(''.join(job['chunks']))
+        payload['job_id'] = job_id
+        payload['status'] = job['status']
+    return payload
+
+def stream_llm_job(job_id):
+    """逐段产出任务生成的内容，生成 (event, data) 二元组"""
+    job = _jobs.get(job_id)
+    if job is None:
+        cached = _cached_result(job_id)
+        if cached:
+            yield 'token', {'text': cached['llm_analysis']}
+            yield 'done', cached
+        return
+    condition = job['condition']
+    sent = 0
+    while True:
+        with condition:
+            if sent == len(job['chunks']) and not job['result']:
+                condition.wait(timeout=STREAM_TIMEOUT)
+            chunks = job['chunks'][sent:]
+            finished = job['result'] is not None
+        if not chunks and not finished:
+            # 等待超时，结束流，客户端可改为轮询（在锁外产出，避免生成器挂起时持有锁）
+            yield 'timeout', {'job_id': job_id}
+            return
+        for chunk in chunks:
+            yield 'token', {'text': chunk}
+        sent += len(chunks)
+        if finished and sent >= len(job['chunks']):
+            yield 'done', get_llm_job(job_id)
+            return
@@ -0,0 +1,88 @@
+import threading
+import time
+import logging
+from datetime import datetime
+from services.stock_service import get_stock_data
+from services.risk_analysis import analyze_market_trend
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 各市场对应的大盘指数
+MARKET_INDEX = {
+    'CN': {
+        'SH': '000001',  # 上证指数
+        'SZ': '399001'   # 深证成指
+    },
+    'US': '^GSPC'        # 标普500
+}
+REFRESH_INTERVAL = 300  # 后台刷新间隔（秒）
+
+_contexts = {}
+_lock = threading.Lock()
+_refresher = None
+_flight = SingleFlight('market_context')
+
+def _index_symbol(market):
+    index_symbol = MARKET_INDEX.get(market)
+    if isinstance(index_symbol, dict):
+        return index_symbol['SH']
+    return index_symbol
+
+def refresh_market_context(market):
+    """重新获取大盘数据并预先计算走势和情绪分析，并发调用共享同一次刷新"""
+    return _flight.do(market, _refresh_market_context, market)
+
+def _refresh_market_context(market):
+    index_symbol = _index_symbol(market)
+    if not index_symbol:
+        return None
+    try:
+        index_data = get_stock_data(market, index_symbol)
+        analysis = analyze_market_trend(index_data)
+        context = {
+            'market': market,
+            'index_symbol': index_symbol,
+            'index_data': index_data,
+            'analysis': analysis,
+            'last_date': index_data.last_date if index_data else None,
+            'updated_at': datetime.now().isoformat()
+        }
+        with _lock:
+            _contexts[market] = context
+        logger.info(f'大盘数据缓存已更新 - {market}:{index_symbol}, 最新日期: {context["last_date"]}')
+        return context
+    except Exception as e:
+        logger.error(f'更新大盘数据缓存失败 - {market}: {str(e)}')
+        return None
+
+def get_market_context(market):
+    """读取大盘缓存，首次访问时同步构建并启动后台刷新"""
+    _ensure_refresher()
+    context = _contexts.get(market)
+    if context is None and market in MARKET_INDEX:
+        context = refresh_market_context(market)
+    return context
+
+def get_market_index_data(market):
+    """获取大盘指数数据"""
+    context = get_market_context(market)
+    return context['index_data'] if context else None
+
+def _refresh_loop(interval):
+    while True:
+        time.sleep(interval)
+        for market in MARKET_INDEX:
+            refresh_market_context(market)
+
+def _ensure_refresher(interval=REFRESH_INTERVAL):
+    """启动后台刷新线程（每个进程只启动一次）"""
+    global _refresher
+    if _refresher is not None:
+        return
+    with _lock:
+        if _refresher is None:
+            _refresher = threading.Thread(
+                target=_refresh_loop, args=(interval,), name='market-context', daemon=True
+            )
+            _refresher.start()
@@ -0,0 +1,190 @@
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from services.stock_service import (
+    db, format_stock_symbol, get_stocks_data_batch, refresh_stock_info,
+    MARKET_SESSIONS, INFO_TTL, is_trading_session, last_settled_close
+)
+from services.market_context import get_market_context
+from services.snapshots import rebuild_snapshots
+from services.llm_service import submit_llm_analysis
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE = timedelta(days=3)     # 访问热度的半衰期
+HOT_WINDOW = timedelta(days=14)   # 超过该时间未访问的股票不再预取
+MAX_HOT_SYMBOLS = 100             # 每个市场最多预取的股票数
+LLM_WARM_LIMIT = 30               # 每个市场按热度预先生成AI分析的股票数
+BATCH_SIZE = 20                   # 每批下载的股票数
+STAGGER_SECONDS = 5               # 批次之间的间隔，与 yfinance 限流配合分散请求
+CHECK_INTERVAL = 60               # 调度线程检查间隔（秒）
+
+_activity = {}   # (market, 格式化代码) -> 访问记录
+_dirty = set()
+_last_runs = {}  # market -> 已预取的收盘时间
+_lock = threading.Lock()
+_scheduler = None
+
+def _decayed_score(record, now):
+    return record['score'] * 0.5 ** ((now - record['last_access']) / HALF_LIFE)
+
+def record_access(market, symbol, period='1y'):
+    """记录一次股票访问，热度按半衰期衰减后加 1"""
+    _ensure_scheduler()
+    formatted_symbol = format_stock_symbol(market, symbol)
+    key = (market, formatted_symbol)
+    now = datetime.now()
+    with _lock:
+        record = _activity.get(key)
+        score = _decayed_score(record, now) + 1 if record else 1.0
+        _activity[key] = {
+            'market': market,
+            'symbol': formatted_symbol,
+            'request_symbol': symbol,
+            'period': period,
+            'score': score,
+            'last_access': now
+        }
+        _dirty.add(key)
+
+def hot_symbols(market, limit=MAX_HOT_SYMBOLS, now=None):
+    """市场内最近访问过的股票，按衰减后的热度降序"""
+    now = now or datetime.now()
+    with _lock:
+        records = [
+            dict(record, score=_decayed_score(record, now))
+            for record in _activity.values()
+            if record['market'] == market and now - record['last_access'] < HOT_WINDOW
+        ]
+    records.sort(key=lambda record: record['score'], reverse=True)
+    return records[:limit]
+
+def load_activity():
+    """从数据库恢复访问记录，内存中已有的较新记录优先"""
+    records = db.get_symbol_activity(datetime.now() - HOT_WINDOW)
+    with _lock:
+        for record in records:
+            key = (record['market'], record['symbol'])
+            current = _activity.get(key)
+            if current is None or current['last_access'] < record['last_access']:
+                _activity[key] = record
+    logger.info(f'恢复股票访问记录 - 数量: {len(records)}')
+
+def flush_activity():
+    """把变化的访问记录写入数据库，并清理过期记录"""
+    expire_before = datetime.now() - HOT_WINDOW
+    with _lock:
+        records = [dict(_activity[key]) for key in _dirty if key in _activity]
+        _dirty.clear()
+        for key in [k for k, record in _activity.items() if record['last_access'] < expire_before]:
+            del _activity[key]
+    db.save_symbol_activity(records, expire_before)
+
+def warm_symbol(market, record, data, snapshot, with_llm=False):
+    """预热单只股票的基本面信息及AI分析缓存"""
+    try:
+        stock_info, last_update = db.get_stock_info(market, record['symbol'])
+        if stock_info is None or datetime.now() - last_update >= INFO_TTL:
+            refresh_stock_info(market, record['request_symbol'])
+
+        # 与 /api/stock 接口相同的输入，生成的结果写入 LLM 缓存
+        if with_llm and snapshot:
+            submit_llm_analysis(data, snapshot['analysis'])
+    except Exception as e:
+        logger.error(f'预热股票失败 - {market}:{record["symbol"]}: {str(e)}')
+
+def prefetch_market(market):
+    """刷新市场内热门股票的K线、基本面信息和分析结果
+
+    按请求范围分组批量下载，批次之间间隔 STAGGER_SECONDS 秒，每批下载后批量重建分析快照；
+    AI分析只为热度最高的 LLM_WARM_LIMIT 只股票预先生成。
+    """
+    hot = hot_symbols(market)
+    if not hot:
+        return 0
+    logger.info(f'开始预取 - 市场: {market}, 股票数: {len(hot)}')
+    started = time.monotonic()
+    market_context = get_market_context(market)
+
+    by_period = {}
+    for rank, record in enumerate(hot):
+        by_period.setdefault(record['period'], []).append((rank, record))
+
+    warmed = 0
+    batches = 0
+    for period, records in by_period.items():
+        for i in range(0, len(records), BATCH_SIZE):
+            if batches:
+                time.sleep(STAGGER_SECONDS)
+            batches += 1
+            batch = records[i:i + BATCH_SIZE]
+            data_by_symbol = get_stocks_data_batch(
+                market, [record['request_symbol'] for _, record in batch], period
+            )
+            snapshots = rebuild_snapshots(market, data_by_symbol, period, market_context)
+            for rank, record in batch:
+                data = data_by_symbol.get(record['request_symbol'])
+                if data:
+                    warm_symbol(market, record, data, snapshots.get(record['request_symbol']),
+                                with_llm=rank < LLM_WARM_LIMIT)
+                    warmed += 1
+
+    logger.info(
+        f'预取完成 - 市场: {market}, 成功: {warmed}/{len(hot)}, 耗时: {time.monotonic() - started:.1f}秒'
+    )
+    return warmed
+
+def run_due_prefetches(now=None):
+    """对已收盘结算、且本交易日尚未成功预取的市场执行预取"""
+    now = now or datetime.now().astimezone()
+    flush_activity()
+    for market in MARKET_SESSIONS:
+        if is_trading_session(market, now):
+            continue
+        close = last_settled_close(market, now)
+        if _last_runs.get(market) == close:
+            continue
+        try:
+            # 部分股票成功即视为完成；有热门股票却全部失败时（如上游不可用）稍后重试
+            if not prefetch_market(market) and hot_symbols(market):
+                raise Exception('热门股票全部预取失败')
+        except Exception as e:
+            # 不记录本次收盘时间，下次检查时重试
+            logger.error(f'预取失败 - 市场: {market}: {str(e)}', exc_info=True)
+            continue
+        _last_runs[market] = close
+
+def get_prefetch_status():
+    """各市场最近一次预取对应的收盘时间和热门股票"""
+    return {
+        market: {
+            'last_close': _last_runs[market].isoformat() if market in _last_runs else None,
+            'hot_symbols': [
+                {'symbol': record['symbol'], 'period': record['period'], 'score': round(record['score'], 3)}
+                for record in hot_symbols(market)
+            ]
+        }
+        for market in MARKET_SESSIONS
+    }
+
+def _scheduler_loop(interval):
+    load_activity()
+    while True:
+        time.sleep(interval)
+        try:
+            run_due_prefetches()
+        except Exception as e:
+            logger.error(f'预取调度失败: {str(e)}', exc_info=True)
+
+def _ensure_scheduler(interval=CHECK_INTERVAL):
+    """启动后台预取调度线程（每个进程只启动一次）"""
+    global _scheduler
+    if _scheduler is not None:
+        return
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_scheduler_loop, args=(interval,), name='prefetch', daemon=True
+            )
+            _scheduler.start()
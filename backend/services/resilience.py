@@ -0,0 +1,255 @@
+import time
+import functools
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+from services.cache import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的截止时间（time.monotonic() 时刻），通过 concurrency.submit 传递到工作线程
+_deadline = contextvars.ContextVar('deadline', default=None)
+_upstreams = {}
+_registry_lock = threading.Lock()
+
+class UpstreamUnavailable(Exception):
+    """上游服务熔断中或限流等待超过截止时间，调用被直接拒绝"""
+
+class DeadlineExceeded(TimeoutError):
+    """请求已超过截止时间"""
+
+@contextmanager
+def deadline(seconds):
+    """在当前上下文中设置截止时间，只会缩短外层已有的截止时间"""
+    value = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        value = min(value, current)
+    token = _deadline.set(value)
+    try:
+        yield value
+    finally:
+        _deadline.reset(token)
+
+def with_deadline(seconds):
+    """装饰器：被装饰的函数（如 Flask 接口）在 seconds 秒的截止时间内执行"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with deadline(seconds):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def remaining(default=None):
+    """距截止时间的剩余秒数，未设置截止时间时返回 default"""
+    current = _deadline.get()
+    if current is None:
+        return default
+    return max(0.0, current - time.monotonic())
+
+def bounded_timeout(timeout):
+    """单次网络请求的超时时间，不超过剩余时间"""
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
+
+def is_throttled(error):
+    """判断异常是否为上游限流（HTTP 429）"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return 'too many requests' in message or 'rate limit' in message
+
+class TokenBucket:
+    """自适应令牌桶
+
+    被上游限流时速率减半（不低于 min_rate），之后每次成功调用恢复 base_rate 的十分之一，
+    即 AIMD 调整，使请求速率贴近上游实际允许的速率。
+    """
+
+    def __init__(self, rate, capacity, min_rate=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 8
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """获取一个令牌，最多等待 timeout 秒（None 表示一直等待），等不到时立即返回 False"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if end is not None and now + wait > end:
+                return False
+            time.sleep(wait)
+
+    def throttle(self):
+        """上游返回限流时降低速率，并清空已积累的令牌"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+        logger.warning(f'上游限流，请求速率降至 {self.rate:.2f}/秒')
+
+    def recover(self):
+        """调用成功后逐步恢复速率"""
+        if self.rate < self.base_rate:
+            with self._lock:
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败 failure_threshold 次后断开，断开期间调用直接被拒绝；
+    reset_timeout 秒后进入半开状态，只放行一个试探请求，成功则恢复，失败则重新断开。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否放行本次调用"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def available(self):
+        """不改变状态地判断当前是否可能放行调用"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return not (self.state == self.HALF_OPEN and self._probing)
+
+    def release(self):
+        """放行后未实际发起调用时归还试探机会"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f'熔断恢复 - {self.name}')
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f'熔断断开 - {self.name}, 连续失败次数: {self._failures}')
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+            return {'state': self.state, 'failures': self._failures, 'retry_in': retry_in}
+
+class Upstream:
+    """上游服务的保护层：令牌桶限流 + 熔断 + 截止时间
+
+    is_failure 判断异常是否计入熔断（例如股票代码不存在不应视为上游故障）。
+    """
+
+    def __init__(self, name, rate, capacity, failure_threshold=5, reset_timeout=30, is_failure=None):
+        self.name = name
+        self.limiter = TokenBucket(rate, capacity)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.is_failure = is_failure or (lambda error: True)
+        self.stats = get_cache_stats(f'upstream.{name}', ('call', 'failure', 'rejected', 'throttled'))
+
+    def available(self):
+        return self.breaker.available()
+
+    @contextmanager
+    def guard(self):
+        """在 with 块中调用上游服务；熔断或等待令牌超过截止时间时抛出 UpstreamUnavailable"""
+        left = remaining()
+        if left is not None and left <= 0:
+            self.stats.incr('rejected')
+            raise DeadlineExceeded(f'{self.name} 请求已超过截止时间')
+        if not self.breaker.allow():
+            self.stats.incr('rejected')
+            raise UpstreamUnavailable(f'{self.name} 服务暂时不可用（熔断中）')
+        if not self.limiter.acquire(left):
+            self.breaker.release()
+            self.stats.incr('rejected')
+            raise UpstreamUnavailable(f'{self.name} 请求过于频繁，等待超过截止时间')
+
+        self.stats.incr('call')
+        try:
+            yield
+        except Exception as e:
+            if is_throttled(e):
+                self.stats.incr('throttled')
+                self.limiter.throttle()
+            if self.is_failure(e):
+                self.stats.incr('failure')
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.limiter.recover()
+        self.breaker.record_success()
+
+    def call(self, fn, *args, **kwargs):
+        with self.guard():
+            return fn(*args, **kwargs)
+
+    def snapshot(self):
+        status = self.breaker.snapshot()
+        status['rate'] = round(self.limiter.rate, 3)
+        return status
+
+def get_upstream(name, rate, capacity, **kwargs):
+    """获取（或创建）指定名称的上游保护层"""
+    with _registry_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(name, rate, capacity, **kwargs)
+        return _upstreams[name]
+
+def get_all_upstream_status():
+    """汇总所有上游服务的熔断状态和当前速率"""
+    with _registry_lock:
+        upstreams = list(_upstreams.values())
+    return {upstream.name: upstream.snapshot() for upstream in upstreams}
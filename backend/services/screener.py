@@ -0,0 +1,278 @@
+import os
+import re
+import operator
+import warnings
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from services.stock_service import db
+
+logger = logging.getLogger(__name__)
+
+LOOKBACK = 80          # 每只股票参与计算的最近K线数（MA60 需要 60 根）
+LOOKBACK_DAYS = 130    # 读取的自然日范围，覆盖 LOOKBACK 根K线
+CHUNK_SIZE = 500       # 每个线程计算的股票数
+MAX_RESULTS = 500
+INDEX_PREFIX = '^'     # Yahoo Finance 的指数代码以 ^ 开头（如大盘指数 ^GSPC）
+CPU_WORKERS = os.cpu_count() or 4
+
+# numpy 的向量化运算会释放 GIL，按股票分块后可以在多个 CPU 核上并行
+_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='screener')
+_universes = {}
+_lock = threading.Lock()
+
+# 与 analyze_stock_risk / analyze_volume / analyze_trend_strength 中的信号一致
+FIELDS = {
+    'close': '最新收盘价',
+    'pct_change': '日涨跌幅(%)',
+    'ma5': '5日均线',
+    'ma20': '20日均线',
+    'ma60': '60日均线',
+    'rsi': 'RSI(14)',
+    'volume_ratio': '近5日成交量/前5日成交量',
+    'change_5d': '5日涨跌幅(%)',
+    'change_20d': '20日涨跌幅(%)',
+    'direction_consistency': '近20日上涨天数占比',
+    'volatility': '年化波动率'
+}
+
+# 需要完整历史的指标（EMA、Wilder 平滑）无法由最近 LOOKBACK 根K线算出，
+# 读取写入K线时推进并持久化的指标状态
+STATE_FIELDS = {
+    'macd': 'MACD(12,26)',
+    'macd_signal': 'MACD信号线(9)',
+    'macd_histogram': 'MACD柱',
+    'rsi_wilder': 'RSI(14, Wilder平滑)'
+}
+FIELDS.update(STATE_FIELDS)
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+_CONDITION_PATTERN = re.compile(r'^\s*(\w+)\s*(<=|>=|<|>)\s*(\S+)\s*$')
+
+def stack_bars(symbols, dates, close, volume, lookback=LOOKBACK):
+    """把 (股票, 日期) 长表堆叠为 股票 × K线 的矩阵
+
+    每只股票按自己的最后一根K线右对齐，不足 lookback 根的左侧填 NaN。
+    返回 (股票代码, 最后日期, 收盘价矩阵, 成交量矩阵)
+    """
+    order = np.lexsort((dates, symbols))
+    symbols, dates, close, volume = symbols[order], dates[order], close[order], volume[order]
+    names, starts, counts = np.unique(symbols, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(names)), counts)
+    ends = starts + counts
+    column = np.arange(len(symbols)) - ends[group] + lookback
+    keep = column >= 0
+
+    close_matrix = np.full((len(names), lookback), np.nan)
+    volume_matrix = np.full((len(names), lookback), np.nan)
+    close_matrix[group[keep], column[keep]] = close[keep]
+    volume_matrix[group[keep], column[keep]] = volume[keep]
+    return names, dates[ends - 1], close_matrix, volume_matrix
+
+def compute_metrics(close, volume):
+    """对 股票 × K线 矩阵按行计算最后一根K线的指标，返回 {字段: 数组}"""
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        last = close[:, -1]
+        delta = np.diff(close, axis=1)
+
+        # RSI 与 IndicatorEngine 一致：简单平均、数据不足时按已有数据计算，
+        # 第一根K线的涨跌记为 0
+        recent = delta[:, -14:]
+        valid = ~np.isnan(close[:, -14:])
+        gain = np.where(valid, np.nan_to_num(np.maximum(recent, 0)), np.nan)
+        loss = np.where(valid, np.nan_to_num(np.maximum(-recent, 0)), np.nan)
+        rs = np.nanmean(gain, axis=1) / np.nanmean(loss, axis=1)
+        rsi = 100 - 100 / (1 + rs)
+
+        # 收益率不足两个时 nanstd 返回 NaN
+        volatility = np.nanstd(delta / close[:, :-1], axis=1, ddof=1) * np.sqrt(252)
+
+        metrics = {
+            'close': last,
+            'pct_change': delta[:, -1] / close[:, -2] * 100,
+            'ma5': np.nanmean(close[:, -5:], axis=1),
+            'ma20': np.nanmean(close[:, -20:], axis=1),
+            'ma60': np.nanmean(close[:, -60:], axis=1),
+            'rsi': rsi,
+            'volume_ratio': volume[:, -5:].sum(axis=1) / volume[:, -10:-5].sum(axis=1),
+            'change_5d': (last - close[:, -5]) / close[:, -5] * 100,
+            'change_20d': (last - close[:, -20]) / close[:, -20] * 100,
+            'direction_consistency': np.count_nonzero(delta[:, -20:] > 0, axis=1) / 20,
+            'volatility': volatility
+        }
+        # 除数为 0（如停牌导致前5日成交量为 0）产生的 inf 按缺失处理，不参与筛选和排序
+        return {field: np.where(np.isfinite(values), values, np.nan) for field, values in metrics.items()}
+
+def compute_metrics_parallel(close, volume):
+    """按股票分块，在线程池中并行计算指标"""
+    if len(close) <= CHUNK_SIZE:
+        return compute_metrics(close, volume)
+    futures = [
+        _executor.submit(compute_metrics, close[i:i + CHUNK_SIZE], volume[i:i + CHUNK_SIZE])
+        for i in range(0, len(close), CHUNK_SIZE)
+    ]
+    chunks = [future.result() for future in futures]
+    return {field: np.concatenate([chunk[field] for chunk in chunks]) for field in chunks[0]}
+
+def state_metrics(market, symbols):
+    """从持久化的指标状态读取各股票最后一根K线的 STATE_FIELDS 指标，缺失时为 NaN"""
+    latest = db.get_latest_indicators_batch(market, symbols.tolist())
+    metrics = {field: np.full(len(symbols), np.nan) for field in STATE_FIELDS}
+    for i, symbol in enumerate(symbols.tolist()):
+        values = latest.get(symbol)
+        if not values:
+            continue
+        for field in STATE_FIELDS:
+            if values.get(field) is not None:
+                metrics[field][i] = values[field]
+    return metrics
+
+class Universe:
+    """某个市场全部已存储股票的最新指标"""
+
+    def __init__(self, market, version, symbols, last_dates, metrics):
+        self.market = market
+        self.version = version
+        self.symbols = symbols
+        self.last_dates = last_dates
+        self.metrics = metrics
+        self.index = {symbol: i for i, symbol in enumerate(symbols.tolist())}
+        self.is_index = np.char.startswith(symbols.astype(str), INDEX_PREFIX)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def empty(cls, market, version):
+        return cls(market, version, np.array([], dtype=str), np.array([], dtype='datetime64[D]'),
+                   {field: np.array([]) for field in FIELDS})
+
+    @classmethod
+    def build(cls, market, version, bars):
+        if bars is None:
+            return cls.empty(market, version)
+        symbols, last_dates, close, volume = stack_bars(*bars)
+        metrics = compute_metrics_parallel(close, volume)
+        metrics.update(state_metrics(market, symbols))
+        return cls(market, version, symbols, last_dates, metrics)
+
+    def merge(self, version, bars):
+        """用部分股票的新数据生成新的 Universe（已有股票替换，新股票追加）"""
+        if bars is None:
+            return Universe(self.market, version, self.symbols, self.last_dates, self.metrics)
+        update = Universe.build(self.market, version, bars)
+        positions = np.array([self.index.get(symbol, -1) for symbol in update.symbols.tolist()], dtype=np.intp)
+        existing = positions >= 0
+
+        symbols = np.concatenate([self.symbols, update.symbols[~existing]])
+        last_dates = np.concatenate([self.last_dates, update.last_dates[~existing]])
+        last_dates[positions[existing]] = update.last_dates[existing]
+        metrics = {}
+        for field in FIELDS:
+            values = np.concatenate([self.metrics[field], update.metrics[field][~existing]])
+            values[positions[existing]] = update.metrics[field][existing]
+            metrics[field] = values
+        return Universe(self.market, version, symbols, last_dates, metrics)
+
+def load_universe(market):
+    """加载市场的指标数据
+
+    首次加载时读取全市场最近的K线并计算；之后只在数据库变化时，
+    重新读取 last_update 晚于上次加载的股票并合并，其余股票沿用已有结果。
+    """
+    version = db.get_market_version(market)
+    universe = _universes.get(market)
+    if universe is not None and universe.version == version:
+        return universe
+
+    with _lock:
+        universe = _universes.get(market)
+        if universe is not None and universe.version == version:
+            return universe
+        if universe is None or not universe.version or not universe.version[1] or version[0] < universe.version[0]:
+            universe = Universe.build(market, version, db.get_market_bars(market, LOOKBACK_DAYS))
+        else:
+            symbols = db.get_updated_symbols(market, universe.version[1])
+            bars = db.get_market_bars(market, LOOKBACK_DAYS, symbols) if symbols else None
+            universe = universe.merge(version, bars)
+            logger.info(f'选股数据增量更新 - 市场: {market}, 更新股票数: {len(symbols)}')
+        _universes[market] = universe
+        logger.info(f'选股数据已更新 - 市场: {market}, 股票数: {len(universe)}')
+        return universe
+
+def parse_condition(condition):
+    """解析筛选条件
+
+    支持字符串 "rsi < 30"、"close > ma20"，或 {"field": "rsi", "op": "<", "value": 30}，
+    value 可以是数字或另一个字段名。
+    """
+    if isinstance(condition, str):
+        match = _CONDITION_PATTERN.match(condition)
+        if not match:
+            raise ValueError(f'无法解析筛选条件: {condition}')
+        field, op, value = match.groups()
+    else:
+        field, op, value = condition.get('field'), condition.get('op'), condition.get('value')
+
+    if field not in FIELDS:
+        raise ValueError(f'不支持的筛选字段: {field}')
+    if op not in OPERATORS:
+        raise ValueError(f'不支持的比较运算符: {op}')
+    if isinstance(value, str) and value in FIELDS:
+        return field, op, value
+    try:
+        return field, op, float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'筛选条件的值无效: {value}')
+
+def screen(market, conditions, sort=None, order='desc', limit=100, include_indices=False):
+    """在市场内所有已存储的股票中筛选同时满足全部条件的股票
+
+    数据库中也存有大盘指数的K线（供大盘分析使用），默认不参与筛选，include_indices 为真时包含。
+    """
+    parsed = [parse_condition(condition) for condition in conditions]
+    if sort is not None and sort not in FIELDS:
+        raise ValueError(f'不支持的排序字段: {sort}')
+    limit = max(1, min(int(limit), MAX_RESULTS))
+
+    universe = load_universe(market)
+    metrics = universe.metrics
+    eligible = np.ones(len(universe), dtype=bool) if include_indices else ~universe.is_index
+    mask = eligible.copy()
+    with np.errstate(invalid='ignore'):
+        for field, op, value in parsed:
+            target = metrics[value] if isinstance(value, str) else value
+            mask &= OPERATORS[op](metrics[field], target)
+
+    matched = np.flatnonzero(mask)
+    if sort is not None:
+        keys = metrics[sort][matched]
+        ranking = np.argsort(np.where(np.isnan(keys), -np.inf if order == 'desc' else np.inf, keys), kind='stable')
+        matched = matched[ranking[::-1] if order == 'desc' else ranking]
+    matched = matched[:limit]
+
+    results = []
+    for index in matched.tolist():
+        item = {
+            'symbol': str(universe.symbols[index]),
+            'date': str(universe.last_dates[index])
+        }
+        for field in FIELDS:
+            value = float(metrics[field][index])
+            item[field] = None if np.isnan(value) else round(value, 4)
+        results.append(item)
+
+    return {
+        'market': market,
+        'universe': int(eligible.sum()),
+        'matched': int(mask.sum()),
+        'results': results
+    }
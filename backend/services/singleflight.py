@@ -0,0 +1,58 @@
+import threading
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from services.cache import get_cache_stats
+from services.resilience import remaining, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """合并同一个键上的并发调用
+
+    同一时刻同一个键只执行一次函数，其他并发调用者等待并共享其结果（或异常）。
+    调用结束后键即被移除，之后的调用会重新执行，不做结果缓存。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = get_cache_stats(f'singleflight.{name}', ('leader', 'shared'))
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """执行 fn(*args, **kwargs)，已有相同 key 的调用在进行时直接等待其结果"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            self.stats.incr('shared')
+            logger.info(f'合并并发请求 - {self.name}: {key}')
+            # 等待者只等到自己的截止时间，执行者的截止时间由执行者自己控制
+            try:
+                return future.result(timeout=remaining())
+            except FutureTimeoutError:
+                if future.done():
+                    raise  # 执行者本身抛出的超时异常
+                raise DeadlineExceeded(f'等待并发请求结果超过截止时间 - {self.name}: {key}')
+
+        self.stats.incr('leader')
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self):
+        """正在执行的键数量"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,110 @@
+import json
+import logging
+from services.stock_service import db
+from services.cache import get_cache_stats
+from services.data_analysis import analyze_stock_data
+from services.analysis_service import StockAnalyzer
+from services.risk_analysis import analyze_stock_risk, analyze_stock_with_market
+
+logger = logging.getLogger(__name__)
+cache_stats = get_cache_stats('analysis_snapshot', ('hit', 'miss', 'error'))
+
+# 分析逻辑或输出格式变化时递增，已有快照随之失效
+ANALYSIS_VERSION = 2
+
+def build_stock_analysis(data, market_context=None):
+    """/api/stock 返回的基础分析和智能分析（不含 LLM 和大盘分析）"""
+    analysis = analyze_stock_data(data)
+    smart_analysis = analyze_stock_risk(data, analysis)
+    return {'analysis': analysis, 'smart_analysis': smart_analysis}
+
+def build_market_analysis(data, market_context):
+    """个股与大盘的对比分析"""
+    return analyze_stock_with_market(data, market_context['index_data'], market_context['analysis'])
+
+def build_analyzer_result(data, market_context=None):
+    """StockAnalyzer 的综合分析"""
+    return StockAnalyzer(data).analyze()
+
+BUILDERS = {
+    'stock': build_stock_analysis,
+    'market': build_market_analysis,
+    'analyzer': build_analyzer_result
+}
+
+def analysis_context(kind, market_context):
+    """除个股K线外影响分析结果的数据指纹（大盘分析取决于指数K线）"""
+    if kind != 'market':
+        return ''
+    index_data = market_context['index_data']
+    return f'{index_data.symbol}:{index_data.dates[0]}:{index_data.last_date}:{bars_hash(index_data)}'
+
+def bars_hash(data):
+    """全部K线价格和成交量的哈希，历史K线被修正（如复权、数据源更正）时也会改变"""
+    return data.content_hash()
+
+def fingerprint(data, context=''):
+    """K线指纹：首末日期、K线数、最新收盘价和全部K线的哈希，任意一根K线变化或数据被替换时都会改变"""
+    return {
+        'version': ANALYSIS_VERSION,
+        'first_date': str(data.dates[0]),
+        'last_date': data.last_date,
+        'bars': len(data),
+        'last_close': float(data.close[-1]),
+        'bars_hash': bars_hash(data),
+        'context': context
+    }
+
+def load_analyses(kind, market, data_by_symbol, period, market_context=None):
+    """批量读取分析快照
+
+    一次查询读取全部股票的快照，指纹一致的直接返回；缺失或失效的重新计算，
+    并在一个事务中写回。返回 (results, errors)，键与 data_by_symbol 一致。
+    """
+    context = analysis_context(kind, market_context)
+    items = [(key, data) for key, data in data_by_symbol.items() if data]
+    stored = db.get_analysis_snapshots(market, period, kind, {data.symbol for _, data in items})
+
+    results = {}
+    errors = {}
+    fresh = []
+    for key, data in items:
+        current = fingerprint(data, context)
+        snapshot = stored.get(data.symbol)
+        if snapshot is not None and snapshot[0] == current:
+            cache_stats.incr('hit')
+            results[key] = json.loads(snapshot[1])
+            continue
+
+        cache_stats.incr('miss')
+        try:
+            payload = BUILDERS[kind](data, market_context)
+        except Exception as e:
+            cache_stats.incr('error')
+            logger.error(f'分析失败 - {kind} {market}:{data.symbol}: {str(e)}')
+            errors[key] = e
+            continue
+        results[key] = payload
+        if payload is not None:
+            fresh.append((market, data.symbol, period, kind, current, payload))
+
+    if fresh:
+        db.save_analysis_snapshots(fresh)
+    return results, errors
+
+def load_analysis(kind, data, period, market_context=None):
+    """读取单只股票的分析快照，计算失败时抛出原异常"""
+    results, errors = load_analyses(kind, data.market, {data.symbol: data}, period, market_context)
+    if data.symbol in errors:
+        raise errors[data.symbol]
+    return results.get(data.symbol)
+
+def rebuild_snapshots(market, data_by_symbol, period, market_context=None):
+    """K线批量更新后重建各类分析快照（未变化的股票不会重新计算），返回基础分析结果"""
+    results, _ = load_analyses('stock', market, data_by_symbol, period)
+    if period == '1y':
+        # /analysis 接口固定使用 1y 数据
+        load_analyses('analyzer', market, data_by_symbol, period)
+    if market_context and market_context['analysis']:
+        load_analyses('market', market, data_by_symbol, period, market_context)
+    return results
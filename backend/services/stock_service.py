@@ -1,38 +1,52 @@
 import yfinance as yf
+from yfinance.exceptions import YFException, YFRateLimitError
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, time
+from zoneinfo import ZoneInfo
 import logging
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import threading
 from services.database import StockDatabase
+from services.bars import BarSeries
+from services.cache import get_cache_stats
+from services.clients import get_http_session
+from services.concurrency import submit_detached
+from services.singleflight import SingleFlight
+from services.resilience import get_upstream, bounded_timeout
 
 logger = logging.getLogger(__name__)
 db = StockDatabase()
+cache_stats = get_cache_stats('stock_data', ('hit', 'miss', 'stale', 'refresh', 'stale_served'))
+info_cache_stats = get_cache_stats('stock_info')
+_info_refreshing = set()
+_info_refresh_lock = threading.Lock()
+# 同一股票的并发请求只访问一次网络、写一次数据库
+_data_flight = SingleFlight('stock_data')
+_info_flight = SingleFlight('stock_info')
 
-def create_session():
-    """创建带有代理和重试机制的会话"""
-    session = requests.Session()
-    
-    # 设置代理
-    proxies = {
-        'http': 'http://127.0.0.1:1024',
-        'https': 'http://127.0.0.1:1024'
-    }
-    session.proxies = proxies
-    
-    # 设置重试机制
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504]
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    
-    logger.info('创建代理会话 - 代理地址: http://127.0.0.1:1024')
-    return session
+def _is_upstream_failure(error):
+    """股票代码不存在、无数据等不计入熔断，网络错误和限流计入"""
+    return not isinstance(error, YFException) or isinstance(error, YFRateLimitError)
+
+# yfinance 请求限流和熔断：熔断期间网络获取立即失败，调用方返回数据库中的过期数据
+yfinance_upstream = get_upstream('yfinance', rate=2, capacity=10, is_failure=_is_upstream_failure)
+
+# 各市场交易时段（忽略节假日，节假日最多多触发一次网络请求）
+MARKET_SESSIONS = {
+    'CN': {'tz': 'Asia/Shanghai', 'open': time(9, 30), 'close': time(15, 0)},
+    'US': {'tz': 'America/New_York', 'open': time(9, 30), 'close': time(16, 0)}
+}
+SETTLE_DELAY = timedelta(minutes=30)  # 收盘后等待数据源结算的时间
+INTRADAY_TTL = timedelta(minutes=5)   # 盘中缓存有效期
+ADJUST_TOLERANCE = 1e-3               # 增量更新时重叠K线收盘价允许的相对误差
+INFO_TTL = timedelta(days=1)          # 基本面信息有效期，过期后后台刷新
+FETCH_TIMEOUT = 10                    # 单次网络请求超时（秒），不超过请求剩余时间
+
+# yfinance period 对应的大致天数，用于判断缓存覆盖范围和截取数据
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653, 'max': None
+}
 
 def format_stock_symbol(market, symbol):
     """格式化股票代码"""
@@ -46,63 +60,114 @@ def format_stock_symbol(market, symbol):
         return symbol
     return symbol
 
-def fetch_stock_data_from_network(market, symbol, period='1y'):
-    """从网络获取股票数据"""
+def fetch_stock_data_from_network(market, symbol, period='1y', start=None):
+    """从网络获取股票数据，指定 start 时只获取该日期（含）之后的数据"""
     try:
-        session = create_session()
-        stock = yf.Ticker(symbol, session=session)
-        df = stock.history(period=period)
+        stock = yf.Ticker(symbol, session=get_http_session())
+        with yfinance_upstream.guard():
+            timeout = bounded_timeout(FETCH_TIMEOUT)
+            if start:
+                df = stock.history(start=start, timeout=timeout, raise_errors=True)
+            else:
+                df = stock.history(period=period, timeout=timeout, raise_errors=True)
         
         if df.empty:
             raise Exception('未获取到数据')
-            
-        data = []
-        for index, row in df.iterrows():
-            try:
-                data_point = {
-                    'date': index.strftime('%Y-%m-%d'),
-                    'open': float(row['Open']),
-                    'high': float(row['High']),
-                    'low': float(row['Low']),
-                    'close': float(row['Close']),
-                    'volume': float(row['Volume']),
-                    'change': float((row['Close'] - row['Open']) / row['Open'] * 100)
-                }
-                data.append(data_point)
-            except Exception as e:
-                logger.warning(f'处理数据点时出错: {str(e)}，跳过此数据点')
-                continue
         
-        return data
+        return frame_to_bars(df, market, symbol)
     except Exception as e:
         logger.error(f"从网络获取数据失败: {str(e)}")
         return None
 
+def frame_to_bars(df, market, symbol):
+    """将 yfinance 返回的 DataFrame 整列转换为 BarSeries，剔除价格缺失或无效的行"""
+    columns = {
+        name: df[column].to_numpy(dtype=np.float64)
+        for name, column in [('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+                             ('close', 'Close'), ('volume', 'Volume')]
+    }
+    valid = np.ones(len(df), dtype=bool)
+    for values in columns.values():
+        valid &= np.isfinite(values)
+    valid &= columns['open'] > 0
+    
+    invalid_count = len(df) - int(valid.sum())
+    if invalid_count:
+        logger.warning(f'跳过无效数据点 {invalid_count} 个 - {market}:{symbol}')
+    
+    index = df.index[valid]
+    if index.tz is not None:
+        index = index.tz_localize(None)  # 保留交易所当地日期
+    columns = {name: values[valid] for name, values in columns.items()}
+    
+    return BarSeries(
+        index.values.astype('datetime64[D]'),
+        columns['open'], columns['high'], columns['low'], columns['close'], columns['volume'],
+        (columns['close'] - columns['open']) / columns['open'] * 100,
+        market=market, symbol=symbol
+    )
+
 def get_stock_data(market, symbol, period='1y', refresh=False):
-    """获取股票数据，优先从数据库获取"""
+    """获取股票数据，优先从数据库获取
+
+    按 (市场, 格式化代码, 范围) 合并并发请求，强制刷新的请求单独合并。
+    """
+    formatted_symbol = format_stock_symbol(market, symbol)
+    key = (market, formatted_symbol, period, 'refresh') if refresh else (market, formatted_symbol, period)
+    return _data_flight.do(key, _load_stock_data, market, symbol, period, refresh)
+
+def _load_stock_data(market, symbol, period, refresh):
     try:
         # 格式化股票代码
         formatted_symbol = format_stock_symbol(market, symbol)
         logger.info(f'开始获取股票数据 - 市场: {market}, 原始代码: {symbol}, 格式化后: {formatted_symbol}')
         
+        # 只读取请求范围内的K线
+        cached_data, last_update, cached_period = db.get_stock_data(
+            market, formatted_symbol, start=period_start(period)
+        )
+        usable = (
+            validate_stock_data(cached_data)
+            and period_covers(cached_period, period)
+        )
+        
         # 如果不是强制刷新，先尝试从数据库获取
-        if not refresh:
-            db_data = db.get_stock_data(market, formatted_symbol)
-            if db_data and validate_stock_data(db_data):
-                logger.info(f'从数据库获取到数据 - 数据点数: {len(db_data)}')
-                return db_data
+        if refresh:
+            cache_stats.incr('refresh')
+        elif not usable:
+            cache_stats.incr('miss')
+        elif check_data_freshness(market, last_update):
+            cache_stats.incr('stale')
+            logger.info(f'数据库数据已过期 - 最后更新: {last_update}')
+        else:
+            cache_stats.incr('hit')
+            data = slice_period(cached_data, period)
+            logger.info(f'从数据库获取到数据 - 数据点数: {len(data)}')
+            return data
         
-        # 从网络获取数据
-        logger.info('从网络获取数据')
-        data = fetch_stock_data_from_network(market, formatted_symbol, period)
+        data = None
+        if usable:
+            # 已有覆盖请求范围的缓存，只增量获取最新的数据
+            data = update_stock_data_incremental(market, formatted_symbol, cached_data)
+            if data is None:
+                cache_stats.incr('stale_served')
+                logger.warning(f'网络获取失败，返回数据库中的过期数据 - 最后更新: {last_update}')
+                return slice_period(cached_data, period)
         
         if not data:
-            raise Exception('获取数据失败')
+            # 从网络获取完整数据，范围取请求和已缓存中较大者，避免缩小缓存
+            fetch_period = wider_period(cached_period, period)
+            logger.info(f'从网络获取数据 - 范围: {fetch_period}')
+            data = fetch_stock_data_from_network(market, formatted_symbol, fetch_period)
             
-        # 保存到数据库
-        logger.info('保存数据到数据库')
-        db.save_stock_data(market, formatted_symbol, data)
+            if not data:
+                raise Exception('获取数据失败')
+                
+            # 保存到数据库
+            logger.info('保存数据到数据库')
+            db.save_stock_data(market, formatted_symbol, data, fetch_period)
         
+        data = slice_period(data, period)
         logger.info(f'数据获取成功 - 数据点数: {len(data)}')
         return data
     except Exception as e:
@@ -110,37 +175,296 @@ def get_stock_data(market, symbol, period='1y', refresh=False):
         logger.error(error_msg)
         raise Exception(error_msg)
 
+def update_stock_data_incremental(market, symbol, cached_data):
+    """增量更新股票数据
+
+    从倒数第二根已存储的K线开始获取：倒数第二根用于校验复权是否变化，
+    最后一根可能是盘中未结算数据，会被新数据覆盖。
+    返回合并后的数据；网络失败返回 None；需要全量重新获取时返回空序列。
+    """
+    anchor_date = incremental_anchor(cached_data)
+    new_data = fetch_stock_data_from_network(market, symbol, start=str(anchor_date))
+    if not new_data:
+        return None
+    
+    merged, new_rows = merge_incremental(market, symbol, cached_data, new_data)
+    if merged is None:
+        return BarSeries.empty(market, symbol)
+    
+    if len(new_rows):
+        db.append_stock_data(market, symbol, new_rows)
+    else:
+        db.touch_stock_data(market, symbol)
+    
+    logger.info(f'增量更新完成 - {market}:{symbol}, 新增/更新数据点数: {len(new_rows)}')
+    return merged
+
+def incremental_anchor(cached_data):
+    """增量获取的起始日期（倒数第二根已存储的K线）"""
+    return cached_data.dates[-2] if len(cached_data) >= 2 else cached_data.dates[-1]
+
+def merge_incremental(market, symbol, cached_data, new_data):
+    """将从锚点开始获取的新数据拼接到缓存数据之后
+
+    返回 (合并后的数据, 需要写入的新K线)；数据不连续或复权变化时返回 (None, None)。
+    """
+    anchor_date = incremental_anchor(cached_data)
+    anchor_close = cached_data.close[np.searchsorted(cached_data.dates, anchor_date)]
+    
+    position = np.searchsorted(new_data.dates, anchor_date)
+    if position >= len(new_data) or new_data.dates[position] != anchor_date:
+        logger.info(f'增量数据与缓存不连续，改为全量获取 - {market}:{symbol}')
+        return None, None
+    if abs(new_data.close[position] - anchor_close) > abs(anchor_close) * ADJUST_TOLERANCE:
+        # 除权/拆股导致历史价格整体复权，增量拼接会产生断层
+        logger.info(f'检测到复权变化，改为全量获取 - {market}:{symbol}')
+        return None, None
+    
+    new_rows = new_data[position + 1:]
+    return BarSeries.concat(cached_data.until(anchor_date), new_rows), new_rows
+
+def fetch_stocks_batch_from_network(market, symbols, period='1y', start=None):
+    """通过一次批量下载获取多只股票数据，返回 {格式化代码: BarSeries}"""
+    try:
+        kwargs = {'start': start} if start else {'period': period}
+        with yfinance_upstream.guard():
+            df = yf.download(
+                symbols,
+                group_by='ticker',
+                auto_adjust=True,
+                progress=False,
+                session=get_http_session(),
+                timeout=bounded_timeout(FETCH_TIMEOUT),
+                **kwargs
+            )
+        if df is None or df.empty:
+            raise Exception('未获取到数据')
+        
+        result = {}
+        for symbol in symbols:
+            if isinstance(df.columns, pd.MultiIndex):
+                if symbol not in df.columns.get_level_values(0):
+                    continue
+                frame = df[symbol]
+            else:
+                frame = df  # 只有一只股票时不分组
+            frame = frame.dropna(how='all')
+            if not frame.empty:
+                result[symbol] = frame_to_bars(frame, market, symbol)
+        
+        logger.info(f'批量获取数据完成 - 市场: {market}, 请求: {len(symbols)}, 成功: {len(result)}')
+        return result
+    except Exception as e:
+        logger.error(f"批量获取数据失败: {str(e)}")
+        return {}
+
+def get_stocks_data_batch(market, symbols, period='1y', refresh=False):
+    """批量获取多只股票数据
+
+    命中缓存的直接返回；过期的按最早锚点一次性增量下载，缺失的一次性全量下载，
+    所有写入在同一个事务内完成。返回 {原始代码: BarSeries}，获取失败的不包含在内。
+    """
+    formatted = {symbol: format_stock_symbol(market, symbol) for symbol in symbols}
+    start = period_start(period)
+    data = {}
+    stale = {}
+    cold = []
+    
+    for formatted_symbol in dict.fromkeys(formatted.values()):
+        cached_data, last_update, cached_period = db.get_stock_data(market, formatted_symbol, start=start)
+        usable = validate_stock_data(cached_data) and period_covers(cached_period, period)
+        if refresh:
+            cache_stats.incr('refresh')
+        elif not usable:
+            cache_stats.incr('miss')
+        elif check_data_freshness(market, last_update):
+            cache_stats.incr('stale')
+        else:
+            cache_stats.incr('hit')
+            data[formatted_symbol] = cached_data
+            continue
+        if usable:
+            stale[formatted_symbol] = cached_data
+        else:
+            cold.append(formatted_symbol)
+    
+    replacements = {}
+    appends = {}
+    if stale:
+        start_date = min(incremental_anchor(cached) for cached in stale.values())
+        fetched = fetch_stocks_batch_from_network(market, list(stale), start=str(start_date))
+        for formatted_symbol, cached_data in stale.items():
+            new_data = fetched.get(formatted_symbol)
+            if not new_data:
+                cache_stats.incr('stale_served')
+                data[formatted_symbol] = cached_data
+                continue
+            merged, new_rows = merge_incremental(market, formatted_symbol, cached_data, new_data)
+            if merged is None:
+                cold.append(formatted_symbol)
+                continue
+            appends[formatted_symbol] = new_rows
+            data[formatted_symbol] = merged
+    
+    if cold:
+        fetched = fetch_stocks_batch_from_network(market, cold, period=period)
+        for formatted_symbol in cold:
+            new_data = fetched.get(formatted_symbol)
+            if new_data:
+                replacements[formatted_symbol] = new_data
+                data[formatted_symbol] = new_data
+            elif formatted_symbol in stale:
+                cache_stats.incr('stale_served')
+                data[formatted_symbol] = stale[formatted_symbol]
+    
+    if replacements or appends:
+        db.save_stock_data_batch(market, replacements, appends, period)
+    
+    return {
+        symbol: slice_period(data[formatted_symbol], period)
+        for symbol, formatted_symbol in formatted.items()
+        if formatted_symbol in data
+    }
+
 def validate_stock_data(data):
     """验证股票数据的完整性"""
-    if not data or not isinstance(data, list):
+    if not isinstance(data, BarSeries) or len(data) == 0:
         return False
-        
-    required_fields = ['date', 'open', 'high', 'low', 'close', 'volume', 'change']
     
-    for item in data:
-        if not all(field in item for field in required_fields):
-            return False
-        if not all(isinstance(item[field], (int, float)) for field in required_fields if field != 'date'):
-            return False
-            
-    return True
+    prices = np.stack([data.open, data.high, data.low, data.close])
+    return bool(np.isfinite(prices).all() and np.isfinite(data.volume).all())
+
+def _period_days(period):
+    """period 对应的天数，max 视为无穷大，未知值返回 None"""
+    if period == 'max':
+        return float('inf')
+    if period == 'ytd':
+        today = datetime.now().date()
+        return (today - today.replace(month=1, day=1)).days + 1
+    return PERIOD_DAYS.get(period)
 
-def check_data_freshness(data, max_age_days=1):
-    """检查数据是否需要更新"""
-    if not data:
+def period_covers(cached_period, period):
+    """判断已缓存的数据范围是否覆盖请求的范围"""
+    cached_days = _period_days(cached_period)
+    requested_days = _period_days(period)
+    if cached_days is None or requested_days is None:
+        return cached_period == period
+    return cached_days >= requested_days
+
+def wider_period(cached_period, period):
+    """返回两个范围中较大的一个"""
+    return cached_period if period_covers(cached_period, period) else period
+
+def period_start(period):
+    """请求范围的起始日期，max 或未知范围返回 None"""
+    days = _period_days(period)
+    if days is None or days == float('inf'):
+        return None
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+def slice_period(data, period):
+    """按请求范围截取数据"""
+    start = period_start(period)
+    if not data or start is None:
+        return data
+    return data.since(start)
+
+def _market_session(market):
+    session = MARKET_SESSIONS.get(market, MARKET_SESSIONS['US'])
+    return session, ZoneInfo(session['tz'])
+
+def is_trading_session(market, now=None):
+    """判断当前是否处于交易时段（含收盘后的结算窗口）"""
+    session, tz = _market_session(market)
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    if now.weekday() >= 5:
+        return False
+    opened = datetime.combine(now.date(), session['open'], tz)
+    settled = datetime.combine(now.date(), session['close'], tz) + SETTLE_DELAY
+    return opened <= now < settled
+
+def last_settled_close(market, now=None):
+    """最近一个已结算交易日的收盘时间"""
+    session, tz = _market_session(market)
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    day = now.date()
+    while True:
+        if day.weekday() < 5:
+            close = datetime.combine(day, session['close'], tz)
+            if close + SETTLE_DELAY <= now:
+                return close
+        day -= timedelta(days=1)
+
+def check_data_freshness(market, last_update, now=None):
+    """检查数据是否需要更新
+
+    盘中按 INTRADAY_TTL 过期；收盘结算后，只要在结算之后更新过就一直有效，
+    直到下一个交易日收盘，已结算的日线不会被重复获取。
+    """
+    if last_update is None:
         return True
-        
-    latest_date = datetime.strptime(data[-1]['date'], '%Y-%m-%d')
-    age = datetime.now() - latest_date
+    if last_update.tzinfo is None:
+        last_update = last_update.astimezone()  # 数据库中保存的是本地时间
+    now = now or datetime.now().astimezone()
+    
+    if is_trading_session(market, now):
+        return now - last_update > INTRADAY_TTL
     
-    return age.days >= max_age_days
+    return last_update < last_settled_close(market, now) + SETTLE_DELAY
 
 def get_stock_info(market, symbol):
-    """获取股票基本信息"""
+    """获取股票基本信息
+
+    优先读取数据库；超过 INFO_TTL 的信息先直接返回，同时在后台刷新，
+    只有从未获取过的股票才会等待网络请求。
+    """
+    formatted_symbol = format_stock_symbol(market, symbol)
+    stock_info, last_update = db.get_stock_info(market, formatted_symbol)
+    if stock_info:
+        if datetime.now() - last_update < INFO_TTL:
+            info_cache_stats.incr('hit')
+        else:
+            info_cache_stats.incr('stale')
+            refresh_stock_info_async(market, symbol)
+        return stock_info
+    
+    info_cache_stats.incr('miss')
+    return refresh_stock_info(market, symbol)
+
+def refresh_stock_info(market, symbol):
+    """从网络获取基本面信息并保存，同一股票的并发请求共享一次获取"""
+    formatted_symbol = format_stock_symbol(market, symbol)
+    return _info_flight.do((market, formatted_symbol), _refresh_stock_info, market, symbol, formatted_symbol)
+
+def _refresh_stock_info(market, symbol, formatted_symbol):
+    stock_info = fetch_stock_info_from_network(market, symbol, formatted_symbol)
+    if stock_info:
+        db.save_stock_info(market, formatted_symbol, stock_info)
+    return stock_info
+
+def refresh_stock_info_async(market, symbol):
+    """在后台刷新基本面信息，同一股票同时只有一个刷新任务"""
+    key = (market, format_stock_symbol(market, symbol))
+    with _info_refresh_lock:
+        if key in _info_refreshing:
+            return
+        _info_refreshing.add(key)
+    
+    def run():
+        try:
+            refresh_stock_info(market, symbol)
+        finally:
+            with _info_refresh_lock:
+                _info_refreshing.discard(key)
+    
+    submit_detached(run)
+
+def fetch_stock_info_from_network(market, symbol, formatted_symbol):
+    """从网络获取股票基本信息"""
     try:
-        formatted_symbol = format_stock_symbol(market, symbol)
-        ticker = yf.Ticker(formatted_symbol)
-        info = ticker.info
+        ticker = yf.Ticker(formatted_symbol, session=get_http_session())
+        with yfinance_upstream.guard():
+            info = ticker.info
         
         # 提取需要的信息
         stock_info = {
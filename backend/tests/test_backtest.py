@@ -0,0 +1,20 @@
+import itertools
+from services.backtest import parameter_sweep, _run_combination
+from test_screener import make_bars
+
+def test_sweep_in_process_pool_matches_inline():
+    """进程池中的参数扫描与在当前进程中逐个回测的结果一致"""
+    bars_by_symbol = {symbol: make_bars(400, seed, symbol) for seed, symbol in enumerate(['AAA', 'BBB', 'CCC'])}
+    grid = {'trend_confidence': [0.5, 0.6, 0.7, 0.8], 'threshold': [0.3, 0.5]}
+
+    results = parameter_sweep(bars_by_symbol, grid)
+    expected = {
+        (confidence, threshold): _run_combination(
+            {'trend_confidence': confidence, 'threshold': threshold}, bars_by_symbol
+        )[1]
+        for confidence, threshold in itertools.product(*grid.values())
+    }
+    assert len(results) == len(expected)
+    for item in results:
+        key = (item['params']['trend_confidence'], item['params']['threshold'])
+        assert item['summary'] == expected[key]
@@ -0,0 +1,14 @@
+from services.indicators import IndicatorEngine, compute_ma, series_key
+from test_screener import make_bars
+
+def test_corrected_history_misses_cache():
+    """首末日期、长度和最新收盘价不变，只修正历史K线时不再命中旧的指标缓存"""
+    data = make_bars(300, 0, 'AAA')
+    stale = IndicatorEngine(data).ma(60)
+
+    corrected = make_bars(300, 0, 'AAA')
+    corrected.close[100:250] *= 0.5
+    assert series_key(corrected) != series_key(data)
+    ma = IndicatorEngine(corrected).ma(60)
+    assert ma.iloc[249] == compute_ma(IndicatorEngine(corrected).close, 60).iloc[249]
+    assert ma.iloc[249] != stale.iloc[249]
@@ -0,0 +1,26 @@
+from services import levels
+from services.bars import BarSeries
+from test_screener import make_bars
+
+def fresh_levels(bars):
+    """不使用缓存的检测器，直接在 bars 上重新计算"""
+    return levels.detect_levels(BarSeries(
+        bars.dates, bars.open, bars.high, bars.low, bars.close, bars.volume, bars.change
+    ))
+
+def test_corrected_history_rebuilds_detector():
+    """首末日期和最新收盘价不变，只修正历史K线时重建检测器"""
+    data = make_bars(300, 0, 'AAA')
+    assert levels.detect_levels(data) == fresh_levels(data)
+
+    corrected = make_bars(300, 0, 'AAA')
+    for column in (corrected.high, corrected.low, corrected.close):
+        column[100:250] *= 0.5
+    assert levels.detect_levels(corrected) == fresh_levels(corrected)
+    assert fresh_levels(corrected) != fresh_levels(data)
+
+def test_shorter_window_reuses_detector():
+    """请求的起点晚于检测器时后移窗口，结果与重新计算一致"""
+    data = make_bars(300, 1, 'BBB')
+    levels.detect_levels(data)
+    assert levels.detect_levels(data[50:]) == fresh_levels(data[50:])
@@ -0,0 +1,16 @@
+import json
+from services.risk_analysis import analyze_volume, analyze_stock_risk
+from services.data_analysis import analyze_stock_data
+from test_screener import make_bars
+
+def test_volume_ratio_is_python_float():
+    result = analyze_volume(make_bars(120, 0, 'AAA'))
+    assert type(result['volume_ratio']) is float
+
+def test_zero_prior_volume():
+    """前5日成交量为 0（停牌）时不产生 inf，分析结果可以序列化为标准 JSON"""
+    data = make_bars(120, 0, 'AAA')
+    data.volume[-10:-5] = 0
+    assert analyze_volume(data) is None
+    smart_analysis = analyze_stock_risk(data, analyze_stock_data(data))
+    json.dumps(smart_analysis, allow_nan=False)
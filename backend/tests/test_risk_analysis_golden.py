@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services import risk_analysis
+from services.bars import BarSeries
+
+# 期望值由向量化改写之前（逐个遍历实现）的 risk_analysis 在相同数据上生成，
+# 改写后的结果必须与之一致
+def make_series(seed, drift, sigma, volume_jump):
+    rng = np.random.default_rng(seed)
+    n = 120
+    dates = pd.bdate_range(end='2024-06-28', periods=n).strftime('%Y-%m-%d')
+    close = 50 * np.exp(np.cumsum(rng.normal(drift, sigma, n)))
+    high = close * (1 + rng.uniform(0, 0.02, n))
+    low = close * (1 - rng.uniform(0, 0.02, n))
+    volume = rng.integers(100000, 200000, n).astype(float)
+    volume[-5:] *= volume_jump
+    change = np.concatenate([[0.0], np.diff(close) / close[:-1] * 100])
+    return BarSeries(dates, close, high, low, close, volume, change, market='US', symbol=f'S{seed}')
+
+CASES = {
+    'rising': (1, 0.004, 0.005, 2.0),
+    'falling': (2, -0.004, 0.005, 0.5),
+    'volatile': (3, 0.0, 0.03, 1.0)
+}
+
+TREND = {
+    'rising': {'trend': '上涨', 'strength': 0.4443815895266929, 'direction_consistency': 0.85,
+               'ma_distance': 0.03876317905338577},
+    'falling': {'trend': '下跌', 'strength': 0.1641052678435021, 'direction_consistency': 0.3,
+                'ma_distance': -0.028210535687004216},
+    'volatile': {'trend': '上涨', 'strength': 0.27989602879372977, 'direction_consistency': 0.55,
+                 'ma_distance': 0.009792057587459513}
+}
+
+SENTIMENT = {
+    'rising': {
+        'score': 60, 'state': '乐观',
+        'factors': ['市场持续上涨，情绪偏乐观', '成交量明显放大，市场活跃度提升', '市场波动平稳，风险偏好适'],
+        'metrics': {'up_days_ratio': 80.0, 'volume_ratio': 1.83, 'volatility': 6.75}
+    },
+    'falling': {
+        'score': -10, 'state': '中性',
+        'factors': ['成交量明显萎缩，市场活跃度下降', '市场波动平稳，风险偏好适'],
+        'metrics': {'up_days_ratio': 30.0, 'volume_ratio': 0.55, 'volatility': 7.82}
+    },
+    'volatile': {
+        'score': -10, 'state': '中性',
+        'factors': ['市场波动剧烈，风险偏好降低'],
+        'metrics': {'up_days_ratio': 55.0, 'volume_ratio': 0.85, 'volatility': 50.96}
+    }
+}
+
+# 没有聚类价位时退回的按 1% 间隔选取的价位
+SUPPORT_RESISTANCE = {
+    'rising': {'support': [75.60246582173326, 76.3988104170843, 77.52077860001921],
+               'resistance': [78.36853807654946, 79.3172872756632]},
+    'falling': {'support': [30.987509976766077, 31.348174935935035],
+                'resistance': [31.532586057508663, 31.955030913796904, 32.294008886582965]},
+    'volatile': {'support': [43.208729883616556, 43.65733776649533, 44.135076755320036],
+                 'resistance': [44.602212301508835, 45.18761974652834, 45.732523507263636]}
+}
+
+@pytest.mark.parametrize('case', CASES)
+def test_trend_strength(case):
+    result = risk_analysis.analyze_trend_strength(make_series(*CASES[case]), None)
+    expected = TREND[case]
+    assert result['trend'] == expected['trend']
+    assert result['direction_consistency'] == expected['direction_consistency']
+    assert result['strength'] == pytest.approx(expected['strength'], rel=1e-12)
+    assert result['ma_distance'] == pytest.approx(expected['ma_distance'], rel=1e-12)
+
+@pytest.mark.parametrize('case', CASES)
+def test_market_sentiment(case):
+    assert risk_analysis.analyze_market_sentiment(make_series(*CASES[case])) == SENTIMENT[case]
+
+@pytest.mark.parametrize('case', CASES)
+def test_support_resistance_fallback(case, monkeypatch):
+    monkeypatch.setattr(risk_analysis, 'detect_levels', lambda data: [])
+    data = make_series(*CASES[case])
+    result = risk_analysis.calculate_support_resistance(data, float(data.close[-1]))
+    expected = SUPPORT_RESISTANCE[case]
+    assert result['support'] == pytest.approx(expected['support'], rel=1e-12)
+    assert result['resistance'] == pytest.approx(expected['resistance'], rel=1e-12)
+    assert result['levels'] == []
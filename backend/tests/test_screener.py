@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services import screener
+from services.bars import BarSeries
+from services.database import StockDatabase
+from services.indicators import IndicatorEngine
+
+def make_bars(n, seed, symbol):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2024-06-28', periods=n).strftime('%Y-%m-%d')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    volume = rng.integers(100000, 1000000, n).astype(float)
+    change = np.concatenate([[0.0], np.diff(close) / close[:-1] * 100])
+    rows = list(zip(dates, close, close * 1.01, close * 0.99, close, volume, change))
+    return BarSeries.from_rows(rows, market='US', symbol=symbol)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = StockDatabase(str(tmp_path / 'test.db'))
+    monkeypatch.setattr(screener, 'db', database)
+    monkeypatch.setattr(screener, '_universes', {})
+    yield database
+    database.close()
+
+def test_state_fields_use_full_history(db):
+    """MACD 等指标来自持久化的指标状态，与在完整历史上计算的结果一致"""
+    series = {symbol: make_bars(300, seed, symbol) for seed, symbol in enumerate(['AAA', 'BBB'])}
+    for symbol, data in series.items():
+        db.save_stock_data('US', symbol, data, '1y')
+
+    results = {item['symbol']: item for item in screener.screen('US', [], limit=10)['results']}
+    for symbol, data in series.items():
+        macd = IndicatorEngine(data).macd().iloc[-1]
+        rsi = IndicatorEngine(data).rsi(method='wilder').iloc[-1]
+        assert results[symbol]['macd'] == pytest.approx(macd['macd'], abs=1e-4)
+        assert results[symbol]['macd_signal'] == pytest.approx(macd['signal'], abs=1e-4)
+        assert results[symbol]['macd_histogram'] == pytest.approx(macd['histogram'], abs=1e-4)
+        assert results[symbol]['rsi_wilder'] == pytest.approx(rsi, abs=1e-4)
+
+    matched = screener.screen('US', ['macd > 0'])['results']
+    assert [item['symbol'] for item in matched] == sorted(
+        symbol for symbol, data in series.items() if IndicatorEngine(data).macd()['macd'].iloc[-1] > 0
+    )
+
+def test_state_fields_missing_state(db):
+    """没有指标状态的股票，状态指标为空，其余指标照常计算"""
+    db.save_stock_data('US', 'AAA', make_bars(120, 0, 'AAA'), '1y')
+    with db._connection() as conn:
+        conn.execute('DELETE FROM indicator_state')
+        conn.commit()
+
+    item = screener.screen('US', [])['results'][0]
+    for field in screener.STATE_FIELDS:
+        assert item[field] is None
+    assert item['ma20'] is not None
+
+def test_indices_excluded_by_default(db):
+    """大盘指数（^GSPC）默认不参与筛选，include_indices 为真时包含"""
+    for seed, symbol in enumerate(['AAA', '^GSPC']):
+        db.save_stock_data('US', symbol, make_bars(120, seed, symbol), '1y')
+
+    result = screener.screen('US', ['close > 0'])
+    assert result['universe'] == 1
+    assert [item['symbol'] for item in result['results']] == ['AAA']
+
+    result = screener.screen('US', ['close > 0'], include_indices=True)
+    assert result['universe'] == 2
+    assert sorted(item['symbol'] for item in result['results']) == ['AAA', '^GSPC']
+
+def test_non_finite_metrics_are_missing(db):
+    """前5日成交量为 0 时 volume_ratio 为空，不会被筛选出或排在最前"""
+    suspended = make_bars(120, 0, 'AAA')
+    suspended.volume[-10:-5] = 0
+    db.save_stock_data('US', 'AAA', suspended, '1y')
+    db.save_stock_data('US', 'BBB', make_bars(120, 1, 'BBB'), '1y')
+
+    result = screener.screen('US', ['close > 0'], sort='volume_ratio')
+    assert [item['symbol'] for item in result['results']] == ['BBB', 'AAA']
+    assert result['results'][1]['volume_ratio'] is None
+    assert 'AAA' not in [item['symbol'] for item in screener.screen('US', ['volume_ratio > 1'])['results']]
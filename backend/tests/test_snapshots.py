@@ -0,0 +1,62 @@
+import json
+import sqlite3
+import pytest
+from services import snapshots, levels
+from services.indicators import clear_indicator_cache
+from services.database import StockDatabase
+from test_screener import make_bars
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = StockDatabase(str(tmp_path / 'test.db'))
+    monkeypatch.setattr(snapshots, 'db', database)
+    yield database
+    database.close()
+
+def test_snapshot_invalidated_by_corrected_history(db, monkeypatch):
+    """首末日期、K线数和最新收盘价都不变，只修正了历史K线时快照也会重新计算"""
+    calls = []
+    monkeypatch.setitem(snapshots.BUILDERS, 'stock',
+                        lambda data, market_context=None: calls.append(data) or {'close': float(data.close.sum())})
+    data = make_bars(120, 0, 'AAA')
+    assert snapshots.load_analysis('stock', data, '1y') == snapshots.load_analysis('stock', data, '1y')
+    assert len(calls) == 1
+
+    corrected = make_bars(120, 0, 'AAA')
+    corrected.close[10] *= 0.5
+    result = snapshots.load_analysis('stock', corrected, '1y')
+    assert len(calls) == 2
+    assert result == {'close': float(corrected.close.sum())}
+
+@pytest.mark.parametrize('kind', ['stock', 'analyzer'])
+def test_builders_recompute_corrected_history(db, kind):
+    """使用真实的分析函数：修正历史K线后的快照与清空进程内缓存后重新计算的结果一致"""
+    data = make_bars(300, 0, 'AAA')
+    stale = snapshots.load_analysis(kind, data, '1y')
+
+    corrected = make_bars(300, 0, 'AAA')
+    for column in (corrected.high, corrected.low, corrected.close):
+        column[100:250] *= 0.5
+    result = snapshots.load_analysis(kind, corrected, '1y')
+
+    clear_indicator_cache()
+    levels._detectors.clear()
+    expected = snapshots.BUILDERS[kind](corrected)
+    assert json.dumps(result, sort_keys=True, default=str) == json.dumps(expected, sort_keys=True, default=str)
+    assert json.dumps(result, sort_keys=True, default=str) != json.dumps(stale, sort_keys=True, default=str)
+
+def test_legacy_snapshot_table_is_rebuilt(tmp_path):
+    """缺少 bars_hash 列的旧版快照表在初始化时被重建"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE analysis_snapshot (market TEXT, symbol TEXT, payload JSON)')
+    conn.execute("INSERT INTO analysis_snapshot VALUES ('US', 'AAA', '{}')")
+    conn.commit()
+    conn.close()
+
+    database = StockDatabase(path)
+    with database._connection() as conn:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(analysis_snapshot)')]
+        assert 'bars_hash' in columns
+        assert conn.execute('SELECT COUNT(*) FROM analysis_snapshot').fetchone()[0] == 0
+    database.close()
@@ -20,6 +20,7 @@ function App() {
   const [drawerVisible, setDrawerVisible] = useState(false);
   const [searchHistory, setSearchHistory] = useState([]);
   const [activeIndicators, setActiveIndicators] = useState([]);
+  const [currentStock, setCurrentStock] = useState(null);
   const { token } = theme.useToken();
 
   // 从localStorage加载搜索历史
@@ -63,6 +64,7 @@ function App() {
       console.log('Received analysis data:', data.analysis);
       setStockData(data);
       setAnalysisData(data.analysis);
+      setCurrentStock({ market: searchInfo.market, symbol: searchInfo.symbol });
       updateSearchHistory(searchInfo.market, searchInfo.symbol);
     }
   };
@@ -133,6 +135,8 @@ function App() {
                   <StockChart 
                     data={stockData.data} 
                     analysis={stockData.analysis}
+                    market={currentStock?.market}
+                    symbol={currentStock?.symbol}
                     indicators={activeIndicators}
                     onIndicatorRemove={handleIndicatorRemove}
                   />
@@ -1,14 +1,71 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { Card, Typography, Divider, Spin } from 'antd';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import rehypeRaw from 'rehype-raw';
+import axios from 'axios';
 
 const { Text } = Typography;
 
-const AIAnalysis = ({ llmAnalysis }) => {
-  // 检查并打印接收到的数据结构
-  console.log('AI Analysis Data:', llmAnalysis);
+const isFinished = (job) => !job?.job_id || job.status === 'done' || job.status === 'error';
+
+const AIAnalysis = ({ llmAnalysis: initialAnalysis }) => {
+  const [llmAnalysis, setLlmAnalysis] = useState(initialAnalysis);
+
+  // 后台分析任务：优先使用SSE逐段接收，失败时改为轮询
+  useEffect(() => {
+    setLlmAnalysis(initialAnalysis);
+    if (isFinished(initialAnalysis)) {
+      return undefined;
+    }
+
+    const jobId = initialAnalysis.job_id;
+    let closed = false;
+    let pollTimer = null;
+    let source = null;
+
+    const poll = async () => {
+      try {
+        const response = await axios.get(`http://localhost:5000/api/llm/jobs/${jobId}`);
+        if (closed) return;
+        const job = response.data.data;
+        setLlmAnalysis(job);
+        if (isFinished(job)) return;
+      } catch (error) {
+        if (closed || error.response?.status === 404) return;
+      }
+      pollTimer = setTimeout(poll, 2000);
+    };
+
+    if (window.EventSource) {
+      let text = '';
+      source = new EventSource(`http://localhost:5000/api/llm/jobs/${jobId}/stream`);
+      source.addEventListener('token', (event) => {
+        text += JSON.parse(event.data).text;
+        setLlmAnalysis(prev => ({ ...prev, llm_analysis: text, status: 'running' }));
+      });
+      source.addEventListener('done', (event) => {
+        source.close();
+        setLlmAnalysis(JSON.parse(event.data));
+      });
+      source.addEventListener('timeout', () => {
+        source.close();
+        poll();
+      });
+      source.onerror = () => {
+        source.close();
+        if (!closed) poll();
+      };
+    } else {
+      poll();
+    }
+
+    return () => {
+      closed = true;
+      if (source) source.close();
+      clearTimeout(pollTimer);
+    };
+  }, [initialAnalysis]);
 
   if (!llmAnalysis || !llmAnalysis.llm_analysis) {
     return (
@@ -57,6 +114,12 @@ const AIAnalysis = ({ llmAnalysis }) => {
           </>
         )}
 
+        {!isFinished(llmAnalysis) && (
+          <div style={{ marginBottom: '12px' }}>
+            <Spin size="small" /> <Text type="secondary">AI分析生成中...</Text>
+          </div>
+        )}
+
         {/* Markdown 内容 */}
         <div className="markdown-content">
           <ReactMarkdown
@@ -30,6 +30,13 @@ const PRESETS = {
       { period: 5, k: 3, d: 3, label: '短周期' },
     ],
   },
+  BOLL: {
+    combinations: [
+      { period: 20, std: 2, label: '标准' },
+      { period: 10, std: 1.5, label: '短周期' },
+      { period: 50, std: 2.5, label: '长周期' },
+    ],
+  },
 };
 
 const IndicatorSettings = ({ visible, indicator, onOk, onCancel }) => {
@@ -120,6 +127,7 @@ const IndicatorSettings = ({ visible, indicator, onOk, onCancel }) => {
         );
       case 'MACD':
       case 'KDJ':
+      case 'BOLL':
         return (
           <>
             {getPresetSelector()}
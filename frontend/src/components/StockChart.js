@@ -1,7 +1,8 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { Stock } from '@ant-design/plots';
 import { Card, Space, Tag, Tooltip } from 'antd';
 import { InfoCircleOutlined } from '@ant-design/icons';
+import axios from 'axios';
 
 const INDICATOR_TIPS = {
   MA5: '5日移动平均线，反映短期价格趋势，常用于判断短期支撑和阻力位',
@@ -20,13 +21,77 @@ const IndicatorLabel = ({ label, tip }) => (
   </Tooltip>
 );
 
-const StockChart = ({ data, analysis, indicators = [], onIndicatorRemove }) => {
+// 叠加在K线上的指标，其余指标（MACD、RSI、KDJ）只显示最新值
+const OVERLAY_TYPES = ['MA', 'EMA', 'BOLL'];
+
+// 周期类指标的设置表单把周期放在顶层，其余放在 params 中
+const indicatorParams = (indicator) => ({
+  ...indicator.params,
+  ...(indicator.period !== undefined ? { period: indicator.period } : {})
+});
+
+const indicatorLabel = (indicator) => {
+  const params = Object.values(indicatorParams(indicator)).join(',');
+  return `${indicator.type}(${params})`;
+};
+
+const formatValue = (value) => (value === null || value === undefined ? '-' : value.toFixed(2));
+
+const StockChart = ({ data, analysis, market, symbol, indicators = [], onIndicatorRemove }) => {
+  const [indicatorData, setIndicatorData] = useState({});
+
+  // 指标由后端按参数计算并缓存，修改参数时只需重新请求
+  useEffect(() => {
+    if (!market || !symbol || indicators.length === 0) {
+      setIndicatorData({});
+      return;
+    }
+    let cancelled = false;
+    axios.post(`http://localhost:5000/api/stock/${market}/${symbol}/indicators`, {
+      indicators: indicators.map(indicator => ({
+        type: indicator.type,
+        params: indicatorParams(indicator)
+      }))
+    }).then(response => {
+      if (cancelled || response.data.status !== 'success') return;
+      const { dates, indicators: results } = response.data.data;
+      setIndicatorData(results.reduce((acc, result) => {
+        acc[result.type] = { dates, values: result.values };
+        return acc;
+      }, {}));
+    }).catch(error => {
+      console.error('获取指标数据失败:', error);
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [market, symbol, indicators, data]);
+
   if (!data || !analysis || !Array.isArray(data) || data.length === 0) {
     return null;
   }
 
   const latestData = data[data.length - 1];
 
+  // 按日期对齐后端返回的指标序列
+  const overlayLines = indicators
+    .filter(indicator => OVERLAY_TYPES.includes(indicator.type) && indicatorData[indicator.type])
+    .flatMap(indicator => {
+      const { dates, values } = indicatorData[indicator.type];
+      return Object.entries(values).map(([name, series]) => {
+        const byDate = {};
+        dates.forEach((date, index) => {
+          byDate[date] = series[index];
+        });
+        return {
+          field: `${indicator.type}_${name}`,
+          label: indicator.type === 'BOLL' ? name.toUpperCase() : indicatorLabel(indicator),
+          color: indicator.color,
+          byDate
+        };
+      });
+    });
+
   // 格式化数据
   const stockData = data.map(item => ({
     date: item.date,
@@ -35,14 +100,21 @@ const StockChart = ({ data, analysis, indicators = [], onIndicatorRemove }) => {
     high: item.high,
     low: item.low,
     volume: item.volume,
-    ...indicators.reduce((acc, indicator) => {
-      if (indicator.type === 'MA') {
-        acc[`ma${indicator.params.period}`] = analysis.moving_average[`MA${indicator.params.period}`][data.indexOf(item)];
-      }
+    ...overlayLines.reduce((acc, line) => {
+      acc[line.field] = line.byDate[item.date] ?? null;
       return acc;
     }, {})
   }));
 
+  // 非叠加指标在标签中显示最新值
+  const latestValues = (indicator) => {
+    const result = indicatorData[indicator.type];
+    if (!result || OVERLAY_TYPES.includes(indicator.type)) return '';
+    return ' ' + Object.entries(result.values)
+      .map(([name, series]) => `${name.toUpperCase()}:${formatValue(series[series.length - 1])}`)
+      .join(' ');
+  };
+
   const config = {
     data: stockData,
     xField: 'date',
@@ -65,29 +137,24 @@ const StockChart = ({ data, analysis, indicators = [], onIndicatorRemove }) => {
     theme: {
       colors10: ['#ef5350', '#26a69a'],
     },
-    annotations: indicators.map(indicator => {
-      if (indicator.type === 'MA') {
-        return {
-          type: 'line',
-          xField: 'date',
-          yField: `ma${indicator.params.period}`,
-          style: {
-            stroke: indicator.color || '#ffc107',
-            lineWidth: 1,
-            lineDash: [2, 2],
-          },
-          label: {
-            text: `MA${indicator.params.period}`,
-            position: 'left',
-            style: {
-              fill: indicator.color || '#ffc107',
-              fontSize: 12,
-            },
-          },
-        };
-      }
-      return null;
-    }).filter(Boolean),
+    annotations: overlayLines.map(line => ({
+      type: 'line',
+      xField: 'date',
+      yField: line.field,
+      style: {
+        stroke: line.color || '#ffc107',
+        lineWidth: 1,
+        lineDash: [2, 2],
+      },
+      label: {
+        text: line.label,
+        position: 'left',
+        style: {
+          fill: line.color || '#ffc107',
+          fontSize: 12,
+        },
+      },
+    })),
     yAxis: {
       position: 'right',
       grid: {
@@ -119,7 +186,7 @@ const StockChart = ({ data, analysis, indicators = [], onIndicatorRemove }) => {
             closable
             onClose={() => onIndicatorRemove(indicator.key)}
           >
-            {indicator.name}
+            {indicator.name}{latestValues(indicator)}
           </Tag>
         ))}
       </Space>
@@ -10,6 +10,7 @@ const StockSearch = ({ onDataReceived }) => {
   const [symbol, setSymbol] = useState('');
   const [loading, setLoading] = useState(false);
   const [searchHistory, setSearchHistory] = useState([]);
+  const [historyQuotes, setHistoryQuotes] = useState({});
 
   // 从localStorage加载搜索历史
   useEffect(() => {
@@ -59,6 +60,26 @@ const StockSearch = ({ onDataReceived }) => {
     localStorage.setItem('searchHistory', JSON.stringify(newHistory));
   };
 
+  // 打开下拉框时，一次请求批量获取搜索历史的最新行情
+  const loadHistoryQuotes = async () => {
+    if (searchHistory.length === 0) return;
+
+    try {
+      const response = await axios.post('http://localhost:5000/api/stocks/batch', {
+        symbols: searchHistory.map(item => ({ market: item.market, symbol: item.symbol }))
+      });
+      const quotes = {};
+      response.data.data.forEach(item => {
+        if (item.status === 'success') {
+          quotes[`${item.market}:${item.symbol}`] = item.latest;
+        }
+      });
+      setHistoryQuotes(quotes);
+    } catch (error) {
+      console.error('获取搜索历史行情失败:', error);
+    }
+  };
+
   const handleClearHistory = (e) => {
     e.stopPropagation();
     setSearchHistory([]);
@@ -73,23 +94,31 @@ const StockSearch = ({ onDataReceived }) => {
       </div>
       {searchHistory.length > 0 ? (
         <>
-          {searchHistory.map((item, index) => (
-            <div
-              key={index}
-              className="history-item"
-              onClick={() => {
-                setSymbol(item.symbol);
-                setMarket(item.market);
-                handleSearch(false, item.market, item.symbol);
-              }}
-            >
-              <span className="history-market">{item.market}</span>
-              <span className="history-symbol">{item.symbol}</span>
-              <span className="history-time">
-                {new Date(item.time).toLocaleString()}
-              </span>
-            </div>
-          ))}
+          {searchHistory.map((item, index) => {
+            const quote = historyQuotes[`${item.market}:${item.symbol}`];
+            return (
+              <div
+                key={index}
+                className="history-item"
+                onClick={() => {
+                  setSymbol(item.symbol);
+                  setMarket(item.market);
+                  handleSearch(false, item.market, item.symbol);
+                }}
+              >
+                <span className="history-market">{item.market}</span>
+                <span className="history-symbol">{item.symbol}</span>
+                {quote && (
+                  <span className={`history-quote ${quote.change >= 0 ? 'up' : 'down'}`}>
+                    {quote.close.toFixed(2)} ({quote.change.toFixed(2)}%)
+                  </span>
+                )}
+                <span className="history-time">
+                  {new Date(item.time).toLocaleString()}
+                </span>
+              </div>
+            );
+          })}
           <div className="history-footer">
             <Button 
               type="text" 
@@ -127,6 +156,7 @@ const StockSearch = ({ onDataReceived }) => {
             showSearch
             placeholder={market === 'CN' ? '输入股票代码（如：600000）' : '输入股票代码（如：AAPL）'}
             dropdownRender={dropdownRender}
+            onDropdownVisibleChange={(open) => open && loadHistoryQuotes()}
             allowClear
             popupMatchSelectWidth={false}
             dropdownStyle={{ minWidth: '300px' }}
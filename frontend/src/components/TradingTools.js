@@ -82,6 +82,12 @@ const TradingTools = ({ onIndicatorSelect }) => {
                         desc="对近期数据加权的移动平均线"
                         onClick={() => handleIndicatorClick('EMA')}
                       />
+                      <ToolButton
+                        icon={<AreaChartOutlined />}
+                        title="BOLL - 布林带"
+                        desc="均线加减标准差构成的价格通道"
+                        onClick={() => handleIndicatorClick('BOLL')}
+                      />
                     </Space>
                   </Panel>
                   <Panel header="趋势" key="trend">
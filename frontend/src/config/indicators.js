@@ -91,6 +91,24 @@ export const INDICATORS = {
       'KDJ<20可能处于超卖区域',
       'KDJ指标背离可能预示趋势反转'
     ]
+  },
+  BOLL: {
+    name: '布林带',
+    description: '以移动平均线为中轨、上下各若干倍标准差为通道的指标，用于判断价格波动区间',
+    type: 'BOLL',
+    defaultParams: {
+      period: 20,
+      std: 2
+    },
+    paramDescriptions: {
+      period: '计算周期，通常为20',
+      std: '标准差倍数，通常为2'
+    },
+    tips: [
+      '价格触及上轨可能处于超买区域，触及下轨可能处于超卖区域',
+      '通道收窄往往预示即将出现较大波动',
+      '价格沿上轨运行表示强势，沿下轨运行表示弱势'
+    ]
   }
 };
 